@@ -16,12 +16,13 @@ from pathlib import Path
 import folium
 from streamlit_folium import st_folium
 import rasterio
+from rasterio.enums import Resampling
 import numpy as np
 from branca.colormap import LinearColormap
 import fiona
 from shapely.geometry import shape
 from pyproj import Transformer
-import matplotlib.pyplot as plt
+import matplotlib
 
 st.set_page_config(
     page_title="Mapa Interactivo - TERRAF",
@@ -32,6 +33,10 @@ st.set_page_config(
 st.title("🗺️ Mapa Interactivo: Landsat + Mineral + Magnetometría")
 st.markdown("---")
 
+# Entorno GDAL para las lecturas del mapa: caché de bloques acotada y sin
+# listar el directorio buscando sidecars en cada open
+GDAL_ENV = dict(GDAL_CACHEMAX=64, GDAL_DISABLE_READDIR_ON_OPEN='EMPTY_DIR')
+
 @st.cache_resource
 def crear_mapa_interactivo():
     """Crea el mapa interactivo con todas las capas."""
@@ -55,8 +60,8 @@ def crear_mapa_interactivo():
         if banda in ['B01', 'B02', 'B03', 'B04', 'B05', 'B06', 'B07']:
             bandas_dict[banda] = archivo
     
-    # Obtener centro en WGS84
-    with rasterio.open(bandas_dict['B04']) as src:
+    # Obtener centro en WGS84 (solo metadatos, sin leer píxeles)
+    with rasterio.Env(**GDAL_ENV), rasterio.open(bandas_dict['B04']) as src:
         bounds = src.bounds
         transformer = Transformer.from_crs("EPSG:32613", "EPSG:4326", always_xy=True)
         west, south = transformer.transform(bounds.left, bounds.bottom)
@@ -120,29 +125,34 @@ def crear_mapa_interactivo():
         
         if ratio_file.exists():
             try:
-                with rasterio.open(ratio_file) as src:
-                    ratio = src.read(1).astype(float)
+                # Leer directamente a resolución reducida (GDAL usa overviews si existen)
+                factor = 6
+                with rasterio.Env(**GDAL_ENV), rasterio.open(ratio_file) as src:
+                    ratio_small = src.read(
+                        1,
+                        out_shape=(max(1, src.height // factor), max(1, src.width // factor)),
+                        resampling=Resampling.nearest
+                    ).astype(float)
                     bounds_utm = src.bounds
                     
-                    transformer = Transformer.from_crs("EPSG:32613", "EPSG:4326", always_xy=True)
+                    # Mismo par de CRS que la escena: se reutiliza su transformer
                     west_r, south_r = transformer.transform(bounds_utm.left, bounds_utm.bottom)
                     east_r, north_r = transformer.transform(bounds_utm.right, bounds_utm.top)
                 
                 # Normalizar
-                ratio_norm = (ratio - vmin_val) / (vmax_val - vmin_val)
-                ratio_norm = np.clip(ratio_norm, 0, 1)
+                ratio_small = (ratio_small - vmin_val) / (vmax_val - vmin_val)
+                ratio_small = np.clip(ratio_small, 0, 1)
                 
-                # Reducir resolución
-                factor = 6
-                ratio_small = ratio_norm[::factor, ::factor]
+                # Colormap aplicado al array completo en una sola llamada
+                # (con colormap=..., folium lo llamaría píxel por píxel)
+                ratio_rgba = matplotlib.colormaps[cmap](ratio_small)
                 
                 folium.raster_layers.ImageOverlay(
-                    image=ratio_small,
+                    image=ratio_rgba,
                     bounds=[[south_r, west_r], [north_r, east_r]],
                     opacity=0.6,
                     name=nombre,
-                    show=False,
-                    colormap=lambda x: plt.colormaps[cmap](x)
+                    show=False
                 ).add_to(m)
                 
             except Exception as e:
@@ -186,7 +196,8 @@ with st.spinner("🗺️ Cargando mapa interactivo..."):
     mapa = crear_mapa_interactivo()
     
     if mapa:
-        st_folium(mapa, width=1400, height=700)
+        # Solo visualización: sin devolver estado, mover/zoom no provoca reruns
+        st_folium(mapa, width=1400, height=700, returned_objects=[])
     else:
         st.error("❌ No se pudo crear el mapa")
 
@@ -33,6 +33,59 @@ if not SGM_AVAILABLE:
     st.error(f"❌ Error al importar módulos necesarios: {import_error}")
     st.stop()
 
+@st.cache_resource(show_spinner=False, max_entries=4)
+def mapa_resultados(ruta, mtime, bbox):
+    """
+    Lee el GeoJSON descargado y arma el mapa de resultados una sola vez por
+    (archivo, mtime, bbox); las interacciones con los widgets reutilizan el
+    mismo mapa en lugar de volver a parsear el archivo.
+    Retorna: mapa folium, texto del GeoJSON, número de features, propiedades
+    del primer feature
+    """
+    with open(ruta, 'r') as f:
+        texto = f.read()
+    geojson_data = json.loads(texto)
+    features = geojson_data.get('features', [])
+    
+    center_lat = (bbox[1] + bbox[3]) / 2
+    center_lon = (bbox[0] + bbox[2]) / 2
+    
+    m_result = folium.Map(
+        location=[center_lat, center_lon],
+        zoom_start=9,
+        tiles='OpenStreetMap'
+    )
+    
+    # Agregar capa de magnetometría
+    folium.GeoJson(
+        geojson_data,
+        name='Magnetometría',
+        style_function=lambda x: {
+            'fillColor': 'blue',
+            'color': 'blue',
+            'weight': 1,
+            'fillOpacity': 0.3
+        },
+        tooltip=folium.GeoJsonTooltip(
+            fields=['RANGO_CODE'] if 'RANGO_CODE' in geojson_data['features'][0].get('properties', {}) else [],
+            aliases=['Código:']
+        )
+    ).add_to(m_result)
+    
+    # Agregar área de interés
+    folium.Rectangle(
+        bounds=[[bbox[1], bbox[0]], [bbox[3], bbox[2]]],
+        color='red',
+        fill=False,
+        weight=2,
+        popup="Área solicitada"
+    ).add_to(m_result)
+    
+    folium.LayerControl().add_to(m_result)
+    
+    primeras_propiedades = features[0]['properties'] if features else None
+    return m_result, texto, len(features), primeras_propiedades
+
 # Información
 with st.expander("ℹ️ Acerca de esta herramienta", expanded=False):
     st.markdown("""
@@ -132,8 +185,9 @@ with col2:
         icon=folium.Icon(color='red', icon='info-sign')
     ).add_to(m)
     
-    # Mostrar mapa
-    st_folium(m, width=700, height=400)
+    # Mostrar mapa (solo visualización: sin devolver estado, mover/zoom no
+    # provoca reruns)
+    st_folium(m, width=700, height=400, returned_objects=[])
 
 # Sección de descarga
 st.markdown("---")
@@ -195,11 +249,11 @@ if st.session_state.magnetometria_path:
     mag_path = Path(st.session_state.magnetometria_path)
     
     if mag_path.exists():
-        # Leer GeoJSON
-        with open(mag_path, 'r') as f:
-            geojson_data = json.load(f)
-        
-        n_features = len(geojson_data.get('features', []))
+        # Leer GeoJSON y armar el mapa (cacheado mientras el archivo no cambie)
+        file_stat = mag_path.stat()
+        m_result, geojson_texto, n_features, primeras_propiedades = mapa_resultados(
+            str(mag_path), file_stat.st_mtime, tuple(bbox)
+        )
         
         col_res1, col_res2, col_res3 = st.columns(3)
         
@@ -207,7 +261,7 @@ if st.session_state.magnetometria_path:
             st.metric("Polígonos", f"{n_features:,}")
         
         with col_res2:
-            file_size = mag_path.stat().st_size / 1024  # KB
+            file_size = file_stat.st_size / 1024  # KB
             st.metric("Tamaño", f"{file_size:.1f} KB")
         
         with col_res3:
@@ -216,56 +270,21 @@ if st.session_state.magnetometria_path:
         # Mostrar en mapa
         st.markdown("### 🗺️ Visualización")
         
-        m_result = folium.Map(
-            location=[center_lat, center_lon],
-            zoom_start=9,
-            tiles='OpenStreetMap'
-        )
+        st_folium(m_result, width=900, height=500, returned_objects=[])
         
-        # Agregar capa de magnetometría
-        folium.GeoJson(
-            geojson_data,
-            name='Magnetometría',
-            style_function=lambda x: {
-                'fillColor': 'blue',
-                'color': 'blue',
-                'weight': 1,
-                'fillOpacity': 0.3
-            },
-            tooltip=folium.GeoJsonTooltip(
-                fields=['RANGO_CODE'] if 'RANGO_CODE' in geojson_data['features'][0].get('properties', {}) else [],
-                aliases=['Código:']
-            )
-        ).add_to(m_result)
-        
-        # Agregar área de interés
-        folium.Rectangle(
-            bounds=[[bbox[1], bbox[0]], [bbox[3], bbox[2]]],
-            color='red',
-            fill=False,
-            weight=2,
-            popup="Área solicitada"
-        ).add_to(m_result)
-        
-        folium.LayerControl().add_to(m_result)
-        
-        st_folium(m_result, width=900, height=500)
-        
-        # Botón de descarga del archivo
-        with open(mag_path, 'r') as f:
-            st.download_button(
-                label="💾 Descargar GeoJSON",
-                data=f.read(),
-                file_name=mag_path.name,
-                mime='application/json',
-                use_container_width=True
-            )
+        # Botón de descarga del archivo (el texto ya leído para el mapa)
+        st.download_button(
+            label="💾 Descargar GeoJSON",
+            data=geojson_texto,
+            file_name=mag_path.name,
+            mime='application/json',
+            use_container_width=True
+        )
         
         # Información adicional
         with st.expander("📋 Ver propiedades de los datos"):
             if n_features > 0:
-                first_feature = geojson_data['features'][0]
-                st.json(first_feature['properties'])
+                st.json(primeras_propiedades)
     else:
         st.error("⚠️ Archivo no encontrado")
 
@@ -345,7 +345,7 @@ $$\\frac{\\sigma_I}{I} = \\sqrt{\\left(\\frac{\\sigma_{R_1}}{R_1}\\right)^2 + \\
 - **Sensor:** Landsat 9 OLI-2
 - **Bandas cargadas:** {len(self.pr.bandas)}
 - **Resolución efectiva:** {self.pr.metadatos.get('resolution', 30)} m/píxel
-- **Dimensiones:** {list(self.pr.bandas.values())[0].shape if self.pr.bandas else 'N/A'}
+- **Dimensiones:** {next(iter(self.pr.bandas.values())).shape if self.pr.bandas else 'N/A'}
 - **Fecha de análisis:** {self.fecha}
 
 ### 📊 Parámetros Espectrales Calculados
@@ -435,7 +435,7 @@ Densidad de objetivos prioritarios respecto al área total analizada.
         if zona_key not in self.pr.zonas:
             return 0.0
         
-        n_pixeles = np.sum(self.pr.zonas[zona_key])
+        n_pixeles = self.pr.pixeles_zona(zona_key)
         resolucion = self.pr.metadatos.get('resolution', 30)
         area_km2 = n_pixeles * (resolucion ** 2) / 1e6
         
@@ -5,8 +5,6 @@ Módulo para procesamiento y análisis de datos magnetométricos
 
 import numpy as np
 import pandas as pd
-from scipy import ndimage
-from scipy.signal import savgol_filter
 import warnings
 import os
 
@@ -21,8 +19,10 @@ try:
         extraer_coordenadas_geometrias,
         transformar_coordenadas,
         obtener_bounds_geometrias,
+        crear_grid_regular,
         interpolar_a_grid,
         interpolar_desde_grid,
+        crear_triangulacion,
         calcular_estadisticas_basicas,
         crear_mascara_valida
     )
@@ -32,8 +32,10 @@ except ImportError:
         extraer_coordenadas_geometrias,
         transformar_coordenadas,
         obtener_bounds_geometrias,
+        crear_grid_regular,
         interpolar_a_grid,
         interpolar_desde_grid,
+        crear_triangulacion,
         calcular_estadisticas_basicas,
         crear_mascara_valida
     )
@@ -68,6 +70,7 @@ class TerrafMag:
         # Cache de coordenadas (calcular una sola vez)
         self._coords_cache = None
         self._bounds_cache = None
+        self._tri_cache = None
         
         if dataframe is not None:
             self.datos = dataframe
@@ -99,18 +102,25 @@ class TerrafMag:
             print(f"❌ Error al cargar datos: {str(e)}")
             raise
     
-    def _detectar_columnas(self):
-        """Detecta automáticamente las columnas de campo magnético"""
-        if self.datos is None:
-            return
+    @staticmethod
+    def detectar_columna_campo(columnas, dtypes):
+        """
+        Busca la columna de campo magnético solo por nombre y tipo, sin leer
+        valores (sirve también con el esquema del archivo, antes de cargarlo)
+        
+        Args:
+            columnas: Nombres de las columnas
+            dtypes: Tipos NumPy de cada columna
         
+        Returns:
+            str o None: Nombre de la columna detectada
+        """
         # Buscar columnas con valores de campo magnético
         # RANGO_CODE es el campo oficial del SGM México
         keywords = ['campo', 'magnet', 'nt', 'total', 'anomal', 'tmi', 'rango_code', 'rango', 'cmt']
         exclude_keywords = ['objectid', 'shape_leng', 'shape_area', 'fid', 'carid']
-        columnas = self.datos.columns.tolist()
         
-        for col in columnas:
+        for col, dtype in zip(columnas, dtypes):
             col_lower = col.lower()
             # Saltar columnas de geometría
             if any(ex in col_lower for ex in exclude_keywords):
@@ -118,15 +128,58 @@ class TerrafMag:
                 
             # Buscar columnas con keywords magnéticos
             if any(kw in col_lower for kw in keywords):
-                if self.datos[col].dtype in [np.float64, np.float32, np.int64, np.int32]:
-                    self.campo_total = self.datos[col].values
-                    print(f"📊 Campo magnético detectado en columna: '{col}'")
-                    print(f"   📊 Rango de valores: {np.nanmin(self.campo_total):.2f} - {np.nanmax(self.campo_total):.2f}")
-                    break
+                if dtype in [np.float64, np.float32, np.int64, np.int32]:
+                    return col
+        return None
+    
+    @property
+    def campo_total(self):
+        """Campo magnético total (nT)"""
+        return self._campo_total
+    
+    @campo_total.setter
+    def campo_total(self, valores):
+        # Las estadísticas guardadas son de los valores anteriores: al
+        # reasignar o filtrar el campo se descartan (se recalculan al pedirlas)
+        self._campo_total = valores
+        self.estadisticas = {}
+    
+    def _detectar_columnas(self):
+        """Detecta automáticamente las columnas de campo magnético"""
+        if self.datos is None:
+            return
+        
+        col = self.detectar_columna_campo(self.datos.columns.tolist(), self.datos.dtypes.tolist())
+        if col is not None:
+            self.asignar_campo(col)
+            print(f"📊 Campo magnético detectado en columna: '{col}'")
+            print(f"   📊 Rango de valores: {self.estadisticas.get('min', np.nan):.2f} - {self.estadisticas.get('max', np.nan):.2f}")
         
         if self.campo_total is None:
             print("⚠️ No se detectó automáticamente la columna de campo magnético")
     
+    def asignar_campo(self, columna):
+        """
+        Usa una columna de self.datos como campo total, en float32 contiguo.
+        Los valores en nT caben en float32 (7 cifras): la mitad de memoria
+        para estadísticas, histogramas y normalizaciones. La columna del
+        DataFrame se reemplaza por el mismo array para no duplicarla. Si la
+        conversión pierde precisión se conservan los valores originales.
+        Las estadísticas se calculan aquí, una vez por carga.
+        
+        Args:
+            columna (str): Nombre de la columna con el campo magnético
+        """
+        valores = self.datos[columna].to_numpy()
+        campo = np.ascontiguousarray(valores, dtype=np.float32)
+        if np.allclose(campo, valores, rtol=1e-6, atol=0, equal_nan=True):
+            self.datos[columna] = campo
+            campo = self.datos[columna].to_numpy()
+        else:
+            campo = valores
+        self.campo_total = campo
+        self.calcular_estadisticas()
+    
     def obtener_coordenadas(self, forzar_recalculo=False):
         """
         Obtiene coordenadas X, Y de las geometrías (con cache).
@@ -142,9 +195,33 @@ class TerrafMag:
                 raise ValueError("Datos no tienen columna 'geometry'")
             
             self._coords_cache = extraer_coordenadas_geometrias(self.datos.geometry)
+            self._tri_cache = None
         
         return self._coords_cache
     
+    def obtener_triangulaciones(self, resolution=100):
+        """
+        Obtiene las triangulaciones de los puntos de datos y del grid regular
+        (con cache), para interpolar varios campos sin retriangular.
+        
+        Args:
+            resolution: Resolución del grid regular
+        
+        Returns:
+            tuple: (triangulacion_datos, triangulacion_grid)
+        """
+        x, y = self.obtener_coordenadas()
+        
+        if self._tri_cache is None:
+            self._tri_cache = {'datos': crear_triangulacion(x, y)}
+        
+        cache_key = ('grid', resolution)
+        if cache_key not in self._tri_cache:
+            Xi, Yi = crear_grid_regular(x, y, resolution)
+            self._tri_cache[cache_key] = crear_triangulacion(Xi, Yi)
+        
+        return self._tri_cache['datos'], self._tri_cache[cache_key]
+    
     def obtener_bounds(self, target_crs='EPSG:4326', forzar_recalculo=False):
         """
         Obtiene bounds en sistema de coordenadas especificado (con cache).
@@ -226,6 +303,7 @@ class TerrafMag:
             print(f"✅ Anomalía residual calculada (método: {metodo})")
             
         elif metodo == 'media_movil':
+            from scipy import ndimage
             # Filtro de media móvil como campo regional
             ventana = len(self.campo_total) // 10
             campo_regional = ndimage.uniform_filter1d(self.campo_total, ventana)
@@ -278,8 +356,10 @@ class TerrafMag:
         # Obtener coordenadas (con cache)
         x, y = self.obtener_coordenadas()
         
-        # Interpolar a grid
-        Xi, Yi, Zi = interpolar_a_grid(x, y, self.campo_total, resolution=100, method='cubic')
+        # Interpolar a grid (reutilizando triangulaciones)
+        tri_datos, tri_grid = self.obtener_triangulaciones(resolution=100)
+        Xi, Yi, Zi = interpolar_a_grid(x, y, self.campo_total, resolution=100, method='cubic',
+                                       triangulacion=tri_datos)
         
         # Calcular gradientes
         grad_y, grad_x = np.gradient(Zi)
@@ -291,7 +371,8 @@ class TerrafMag:
         derivada_direccional = grad_x * np.cos(theta) + grad_y * np.sin(theta)
         
         # Interpolar de vuelta a posiciones originales
-        derivada = interpolar_desde_grid(Xi, Yi, derivada_direccional, x, y, method='linear')
+        derivada = interpolar_desde_grid(Xi, Yi, derivada_direccional, x, y, method='linear',
+                                         triangulacion=tri_grid)
         
         self.derivadas[f'direccional_{azimuth}'] = derivada
         print(f"✅ Derivada direccional calculada (azimuth: {azimuth}°)")
@@ -345,8 +426,10 @@ class TerrafMag:
         # Obtener coordenadas (con cache)
         x, y = self.obtener_coordenadas()
         
-        # Interpolar a grid
-        Xi, Yi, Zi = interpolar_a_grid(x, y, self.campo_total, resolution=100, method='cubic')
+        # Interpolar a grid (reutilizando triangulaciones)
+        tri_datos, tri_grid = self.obtener_triangulaciones(resolution=100)
+        Xi, Yi, Zi = interpolar_a_grid(x, y, self.campo_total, resolution=100, method='cubic',
+                                       triangulacion=tri_datos)
         
         # Calcular gradientes
         grad_y, grad_x = np.gradient(Zi)
@@ -355,7 +438,8 @@ class TerrafMag:
         thg_grid = np.sqrt(grad_x**2 + grad_y**2)
         
         # Interpolar de vuelta a posiciones originales
-        thg = interpolar_desde_grid(Xi, Yi, thg_grid, x, y, method='linear')
+        thg = interpolar_desde_grid(Xi, Yi, thg_grid, x, y, method='linear',
+                                    triangulacion=tri_grid)
         
         self.derivadas['thg'] = thg
         print("✅ Gradiente Horizontal Total (THG) calculado")
@@ -543,25 +627,31 @@ class TerrafMag:
         if self.campo_total is None:
             raise ValueError("No hay datos de campo magnético")
         
-        # Calcular umbral
-        mean = np.nanmean(self.campo_total)
-        std = np.nanstd(self.campo_total)
+        # Calcular umbral: media y std ya calculadas al asignar el campo
+        # (cambiar umbral_sigma no vuelve a recorrer el array para ellas);
+        # reasignar campo_total las descarta
+        if 'mean' in self.estadisticas and 'std' in self.estadisticas:
+            mean = self.estadisticas['mean']
+            std = self.estadisticas['std']
+        else:
+            mean = np.nanmean(self.campo_total)
+            std = np.nanstd(self.campo_total)
         umbral_alto = mean + umbral_sigma * std
         umbral_bajo = mean - umbral_sigma * std
         
-        # Detectar anomalías
-        anomalias_altas = self.campo_total > umbral_alto
-        anomalias_bajas = self.campo_total < umbral_bajo
+        # Detectar anomalías (índices una vez; valores a partir de ellos)
+        indices_altas = np.flatnonzero(self.campo_total > umbral_alto)
+        indices_bajas = np.flatnonzero(self.campo_total < umbral_bajo)
         
         resultados = {
-            'n_anomalias_altas': np.sum(anomalias_altas),
-            'n_anomalias_bajas': np.sum(anomalias_bajas),
+            'n_anomalias_altas': len(indices_altas),
+            'n_anomalias_bajas': len(indices_bajas),
             'umbral_alto': umbral_alto,
             'umbral_bajo': umbral_bajo,
-            'indices_altas': np.where(anomalias_altas)[0],
-            'indices_bajas': np.where(anomalias_bajas)[0],
-            'valores_altas': self.campo_total[anomalias_altas],
-            'valores_bajas': self.campo_total[anomalias_bajas]
+            'indices_altas': indices_altas,
+            'indices_bajas': indices_bajas,
+            'valores_altas': self.campo_total[indices_altas],
+            'valores_bajas': self.campo_total[indices_bajas]
         }
         
         print(f"✅ Detectadas {resultados['n_anomalias_altas']} anomalías altas")
@@ -585,8 +675,10 @@ class TerrafMag:
             raise ValueError("No hay datos de campo magnético")
         
         if metodo == 'savgol':
+            from scipy.signal import savgol_filter
             datos_suavizados = savgol_filter(self.campo_total, ventana, orden)
         elif metodo == 'gaussian':
+            from scipy import ndimage
             sigma = ventana / 4
             datos_suavizados = ndimage.gaussian_filter1d(self.campo_total, sigma)
         else:
@@ -649,6 +741,7 @@ class TerrafMag:
         Returns:
             dict: Diccionario con todas las derivadas calculadas
         """
+        from scipy import ndimage
         results = {}
         
         # 1. Derivadas Horizontales usando Sobel (respeta NaN)
@@ -699,10 +792,10 @@ class TerrafMag:
         X, Y = np.meshgrid(x_norm, y_norm)
         
         # Extraer puntos válidos
-        mask = ~np.isnan(grid_mag)
-        x_valid = X[mask].flatten()
-        y_valid = Y[mask].flatten()
-        z_valid = grid_mag[mask].flatten()
+        mask = np.isfinite(grid_mag)
+        x_valid = X[mask]
+        y_valid = Y[mask]
+        z_valid = grid_mag[mask]
         
         # Construir matriz de diseño según grado
         if grado == 1:
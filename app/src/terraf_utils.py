@@ -5,9 +5,17 @@ Funciones centralizadas para evitar código repetido
 """
 
 import numpy as np
+import math
+import functools
 from typing import Tuple, Optional
 import warnings
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 # ============================================================================
 # CONVERSIÓN DE COORDENADAS
 # ============================================================================
@@ -39,6 +47,17 @@ def extraer_coordenadas_geometrias(geometrias) -> Tuple[np.ndarray, np.ndarray]:
         raise ValueError(f"Error extrayendo coordenadas: {e}")
 
 
+@functools.lru_cache(maxsize=16)
+def _transformer(crs_origen, crs_destino):
+    """
+    Transformer de pyproj construido una sola vez por par de CRS (crearlo
+    consulta la base de datos de PROJ)
+    """
+    from pyproj import Transformer
+    
+    return Transformer.from_crs(crs_origen, crs_destino, always_xy=True)
+
+
 def transformar_coordenadas(x, y, crs_origen, crs_destino='EPSG:4326'):
     """
     Transforma coordenadas de un CRS a otro.
@@ -53,9 +72,12 @@ def transformar_coordenadas(x, y, crs_origen, crs_destino='EPSG:4326'):
         tuple: (x_transformado, y_transformado)
     """
     try:
-        from pyproj import Transformer
-        
-        transformer = Transformer.from_crs(crs_origen, crs_destino, always_xy=True)
+        try:
+            transformer = _transformer(crs_origen, crs_destino)
+        except TypeError:
+            # CRS no hashable (p. ej. dict): sin caché
+            from pyproj import Transformer
+            transformer = Transformer.from_crs(crs_origen, crs_destino, always_xy=True)
         x_trans, y_trans = transformer.transform(x, y)
         
         return x_trans, y_trans
@@ -114,7 +136,51 @@ def crear_grid_regular(x, y, resolution=100):
     return Xi, Yi
 
 
-def interpolar_a_grid(x, y, valores, resolution=100, method='cubic'):
+def crear_triangulacion(x, y):
+    """
+    Crea la triangulación de Delaunay de puntos dispersos.
+    
+    Es el paso costoso de la interpolación lineal/cúbica; al pasarla a
+    interpolar_a_grid / interpolar_desde_grid se reutiliza para interpolar
+    varios campos sobre los mismos puntos.
+    
+    Args:
+        x: Coordenadas X
+        y: Coordenadas Y
+    
+    Returns:
+        scipy.spatial.Delaunay: Triangulación reutilizable
+    """
+    from scipy.spatial import Delaunay
+    
+    return Delaunay(np.column_stack([np.ravel(x), np.ravel(y)]))
+
+
+def _interpolar_con_triangulacion(triangulacion, valores, xi, yi, method):
+    """
+    Interpola valores definidos en los vértices de una triangulación existente.
+    
+    Equivalente a griddata(..., fill_value=np.nan) sin retriangular.
+    """
+    from scipy.interpolate import (
+        LinearNDInterpolator, CloughTocher2DInterpolator, NearestNDInterpolator
+    )
+    
+    valores = np.ravel(valores)
+    
+    if method == 'linear':
+        interpolador = LinearNDInterpolator(triangulacion, valores, fill_value=np.nan)
+    elif method == 'cubic':
+        interpolador = CloughTocher2DInterpolator(triangulacion, valores, fill_value=np.nan)
+    elif method == 'nearest':
+        interpolador = NearestNDInterpolator(triangulacion.points, valores)
+    else:
+        raise ValueError(f"Método '{method}' no soportado")
+    
+    return interpolador(xi, yi)
+
+
+def interpolar_a_grid(x, y, valores, resolution=100, method='cubic', triangulacion=None):
     """
     Interpola valores irregulares a grid regular.
     
@@ -124,6 +190,8 @@ def interpolar_a_grid(x, y, valores, resolution=100, method='cubic'):
         valores: Valores a interpolar
         resolution: Resolución del grid
         method: Método de interpolación ('linear', 'cubic', 'nearest')
+        triangulacion: Triangulación de (x, y) creada con crear_triangulacion
+            (opcional, evita reconstruirla en cada llamada)
     
     Returns:
         tuple: (Xi, Yi, Zi) - Grid con valores interpolados
@@ -134,12 +202,15 @@ def interpolar_a_grid(x, y, valores, resolution=100, method='cubic'):
     Xi, Yi = crear_grid_regular(x, y, resolution)
     
     # Interpolar
-    Zi = griddata((x, y), valores, (Xi, Yi), method=method, fill_value=np.nan)
+    if triangulacion is not None:
+        Zi = _interpolar_con_triangulacion(triangulacion, valores, Xi, Yi, method)
+    else:
+        Zi = griddata((x, y), valores, (Xi, Yi), method=method, fill_value=np.nan)
     
     return Xi, Yi, Zi
 
 
-def interpolar_desde_grid(Xi, Yi, Zi, x_target, y_target, method='linear'):
+def interpolar_desde_grid(Xi, Yi, Zi, x_target, y_target, method='linear', triangulacion=None):
     """
     Interpola desde grid regular a puntos irregulares.
     
@@ -148,12 +219,17 @@ def interpolar_desde_grid(Xi, Yi, Zi, x_target, y_target, method='linear'):
         Zi: Valores en el grid
         x_target, y_target: Puntos objetivo
         method: Método de interpolación
+        triangulacion: Triangulación de (Xi, Yi) creada con crear_triangulacion
+            (opcional, evita reconstruirla en cada llamada)
     
     Returns:
         np.ndarray: Valores interpolados
     """
     from scipy.interpolate import griddata
     
+    if triangulacion is not None:
+        return _interpolar_con_triangulacion(triangulacion, Zi, x_target, y_target, method)
+    
     valores = griddata(
         (Xi.flatten(), Yi.flatten()),
         Zi.flatten(),
@@ -183,12 +259,15 @@ def crear_mascara_valida(*arrays):
         raise ValueError("Se requiere al menos un array")
     
     mask = np.ones(arrays[0].shape, dtype=bool)
+    tmp = np.empty(arrays[0].shape, dtype=bool)
     
     for arr in arrays:
-        mask &= ~np.isnan(arr)
-        mask &= ~np.isinf(arr)
+        # isfinite descarta NaN e Inf en una sola pasada; out= evita temporales
+        np.isfinite(arr, out=tmp)
+        np.logical_and(mask, tmp, out=mask)
         if np.issubdtype(arr.dtype, np.number):
-            mask &= (arr != 0)
+            np.not_equal(arr, 0, out=tmp)
+            np.logical_and(mask, tmp, out=mask)
     
     return mask
 
@@ -232,7 +311,7 @@ def calcular_estadisticas_basicas(datos, nombre="datos"):
     Returns:
         dict: Diccionario con estadísticas
     """
-    datos_validos = datos[~np.isnan(datos) & ~np.isinf(datos)]
+    datos_validos = datos[np.isfinite(datos)]
     
     if len(datos_validos) == 0:
         return {
@@ -241,22 +320,213 @@ def calcular_estadisticas_basicas(datos, nombre="datos"):
             'n_total': len(datos)
         }
     
+    # Cuartiles y mediana en una sola partición; min/max una sola vez
+    p25, p50, p75 = np.percentile(datos_validos, [25, 50, 75])
+    vmin = np.min(datos_validos)
+    vmax = np.max(datos_validos)
+    
     return {
         'nombre': nombre,
         'n_total': len(datos),
         'n_validos': len(datos_validos),
         'n_nulos': len(datos) - len(datos_validos),
-        'min': np.min(datos_validos),
-        'max': np.max(datos_validos),
+        'min': vmin,
+        'max': vmax,
         'mean': np.mean(datos_validos),
-        'median': np.median(datos_validos),
+        'median': p50,
         'std': np.std(datos_validos),
-        'percentil_25': np.percentile(datos_validos, 25),
-        'percentil_75': np.percentile(datos_validos, 75),
-        'rango': np.max(datos_validos) - np.min(datos_validos)
+        'percentil_25': p25,
+        'percentil_75': p75,
+        'rango': vmax - vmin
     }
 
 
+def _resumen_validos_np(datos, bins):
+    """
+    n, min, max, media, std e histograma (bins uniformes min-max) de los
+    valores finitos, con NumPy
+    """
+    valid = datos[np.isfinite(datos)]
+    counts = np.zeros(bins, dtype=np.int64)
+    if valid.size == 0:
+        return 0, math.nan, math.nan, math.nan, math.nan, counts
+    
+    vmin, vmax = float(valid.min()), float(valid.max())
+    if vmax > vmin:
+        # Histograma con bincount (min/max ya conocidos)
+        idx = np.subtract(valid, vmin, dtype=np.float64)
+        idx *= bins / (vmax - vmin)
+        idx = idx.astype(np.intp)
+        np.minimum(idx, bins - 1, out=idx)
+        counts = np.bincount(idx, minlength=bins)
+    return (valid.size, vmin, vmax, float(valid.mean(dtype=np.float64)),
+            float(valid.std(dtype=np.float64)), counts)
+
+
+def _resumen_validos_py(datos, bins):
+    # Versión escalar de _resumen_validos_np, compilada con numba: dos
+    # recorridos del array sin copiar los válidos ni crear máscaras
+    n = 0
+    suma = 0.0
+    vmin = math.inf
+    vmax = -math.inf
+    for i in range(datos.size):
+        x = float(datos[i])
+        if math.isfinite(x):
+            n += 1
+            suma += x
+            if x < vmin:
+                vmin = x
+            if x > vmax:
+                vmax = x
+    
+    counts = np.zeros(bins, dtype=np.int64)
+    if n == 0:
+        return 0, math.nan, math.nan, math.nan, math.nan, counts
+    
+    # Segundo recorrido: histograma y desvíos respecto a la media (std en
+    # dos pasadas, como np.std)
+    media = suma / n
+    escala = bins / (vmax - vmin) if vmax > vmin else 0.0
+    desvios = 0.0
+    for i in range(datos.size):
+        x = float(datos[i])
+        if math.isfinite(x):
+            d = x - media
+            desvios += d * d
+            if vmax > vmin:
+                k = int((x - vmin) * escala)
+                if k > bins - 1:
+                    k = bins - 1
+                counts[k] += 1
+    return n, vmin, vmax, media, math.sqrt(desvios / n), counts
+
+
+if NUMBA_AVAILABLE:
+    _resumen_validos = njit(cache=True)(_resumen_validos_py)
+else:
+    _resumen_validos = _resumen_validos_np
+
+
+def resumen_histograma(datos, bins=30):
+    """
+    Estadísticas e histograma de un array ignorando NaN/inf. Con numba se
+    calculan juntos en dos recorridos del array, sin copiar los válidos.
+    
+    Args:
+        datos: Array numpy (cualquier forma)
+        bins: Número de bins uniformes entre min y max
+    
+    Returns:
+        dict: n, min, max, mean, std, counts, edges
+    """
+    datos = np.ravel(datos)
+    if datos.dtype.kind not in 'fiu':
+        datos = datos.astype(np.float64)
+    n, vmin, vmax, media, std, counts = _resumen_validos(datos, bins)
+    
+    if n == 0:
+        edges = np.linspace(0, 1, bins + 1)
+    elif vmax > vmin:
+        edges = np.linspace(vmin, vmax, bins + 1)
+    else:
+        # Valor constante: mismos bins que np.histogram
+        counts, edges = np.histogram(np.array([vmin]), bins=bins)
+        counts = counts * n
+    
+    return {'n': int(n), 'min': vmin, 'max': vmax, 'mean': media, 'std': std,
+            'counts': counts, 'edges': edges}
+
+
+def _mascara_rgb_np(r, g, b):
+    """
+    Píxeles con las tres bandas finitas y > 0, con NumPy
+    """
+    return (r > 0) & (g > 0) & (b > 0) & np.isfinite(r) & np.isfinite(g) & np.isfinite(b)
+
+
+def _mascara_rgb_py(r, g, b):
+    # Versión escalar de _mascara_rgb_np, compilada con numba: un solo
+    # recorrido que escribe la máscara sin temporales (NaN > 0 ya es False,
+    # solo falta descartar +inf)
+    mask = np.empty(r.shape, dtype=np.bool_)
+    for i in range(r.shape[0]):
+        for j in range(r.shape[1]):
+            x = r[i, j]
+            y = g[i, j]
+            z = b[i, j]
+            mask[i, j] = (x > 0 and y > 0 and z > 0 and
+                          x < math.inf and y < math.inf and z < math.inf)
+    return mask
+
+
+if NUMBA_AVAILABLE:
+    _mascara_rgb = njit(cache=True)(_mascara_rgb_py)
+else:
+    _mascara_rgb = _mascara_rgb_np
+
+
+def mascara_rgb_valida(r, g, b):
+    """
+    Máscara de datos válidos de una composición RGB: las tres bandas finitas
+    y mayores que 0 (descarta NoData y bordes negros).
+    
+    Args:
+        r, g, b: Bandas 2D de la misma forma (pueden ser vistas submuestreadas)
+    
+    Returns:
+        np.ndarray: Máscara booleana 2D
+    """
+    return _mascara_rgb(r, g, b)
+
+
+def _estirar_uint8_np(banda, p_low, escala, out):
+    """
+    (banda - p_low) * escala recortado a 0-255, escrito en out (uint8), con NumPy
+    """
+    v = np.subtract(banda, p_low, dtype=np.float32)
+    v *= escala
+    np.clip(v, 0, 255, out=v)
+    out[...] = v
+
+
+def _estirar_uint8_py(banda, p_low, escala, out):
+    # Versión escalar de _estirar_uint8_np, compilada con numba: lee un valor
+    # y escribe un uint8 por píxel, sin temporales float. Misma aritmética
+    # float32; NaN -> 0 (son píxeles sin datos). Recorte con selecciones en
+    # lugar de if/elif para que el bucle se vectorice
+    lo = np.float32(p_low)
+    for i in range(banda.shape[0]):
+        for j in range(banda.shape[1]):
+            v = (np.float32(banda[i, j]) - lo) * escala
+            v = v if v > 0 else np.float32(0)
+            v = v if v < 255 else np.float32(255)
+            out[i, j] = np.uint8(v)
+
+
+if NUMBA_AVAILABLE:
+    _estirar_uint8 = njit(cache=True)(_estirar_uint8_py)
+else:
+    _estirar_uint8 = _estirar_uint8_np
+
+
+def estirar_a_uint8(banda, p_low, p_high, out):
+    """
+    Estiramiento lineal de una banda entre dos valores a 0-255 (para
+    visualización), escrito directamente en un array uint8.
+    
+    Args:
+        banda: Banda 2D (puede ser una vista submuestreada)
+        p_low, p_high: Valores que se llevan a 0 y 255
+        out: Array uint8 2D de la misma forma (p. ej. un canal de una imagen RGBA)
+    
+    Returns:
+        np.ndarray: out
+    """
+    _estirar_uint8(banda, p_low, np.float32(255 / (p_high - p_low)), out)
+    return out
+
+
 # ============================================================================
 # NORMALIZACIÓN
 # ============================================================================
@@ -273,7 +543,7 @@ def normalizar_array(arr, metodo='minmax', percentiles=(2, 98)):
     Returns:
         np.ndarray: Array normalizado
     """
-    arr_valido = arr[~np.isnan(arr) & ~np.isinf(arr)]
+    arr_valido = arr[np.isfinite(arr)]
     
     if len(arr_valido) == 0:
         return arr
@@ -41,6 +41,7 @@ try:
     from terraf_pr import TerrafPR
     from terraf_mag import TerrafMag
     from terraf_download import TerrafDownload
+    from terraf_utils import resumen_histograma, mascara_rgb_valida, estirar_a_uint8
     MODULES_LOADED = True
 except ImportError as e:
     # Mostrar error para debug
@@ -95,195 +96,739 @@ import warnings
 # Silenciar warnings molestos
 warnings.filterwarnings('ignore')
 
-import rasterio
-from rasterio.plot import show
-from rasterio.transform import from_bounds
-from matplotlib import pyplot as plt
-from matplotlib import cm
-import json
+# pyproj y matplotlib se importan dentro de las funciones que los usan
+import re
+import copy
+import functools
+import glob
+import hashlib
+import tempfile
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-import fiona
-from PIL import Image
-import io
+from PIL import Image, features as pil_features
 import base64
 from io import BytesIO
 
-try:
-    import geopandas as gpd
-    GEOPANDAS_AVAILABLE = True
-except (ImportError, AttributeError):
-    GEOPANDAS_AVAILABLE = False
+# WebP para overlays (depende de cómo se compiló Pillow)
+WEBP_AVAILABLE = pil_features.check('webp')
+
+# Calidad WebP con pérdida de los overlays (el alpha se guarda sin pérdida)
+CALIDAD_WEBP = 85
 
 # ============================================================================
 # FUNCIONES AUXILIARES
 # ============================================================================
 
+# Tabla bool -> alpha: False = transparente, True = opaco
+_LUT_ALPHA = np.array([0, 255], dtype=np.uint8)
+
+# Lado máximo (px) de los overlays: el div del mapa no muestra más detalle
+MAX_PX_OVERLAY = 1024
+
+# Overlays servidos como archivos estáticos (server.enableStaticServing)
+OVERLAY_STATIC_DIR = Path(__file__).parent / 'static' / 'overlays'
+MAX_OVERLAYS_ESTATICOS = 128
+
+def _submuestrear_overlay(arr, max_px=MAX_PX_OVERLAY):
+    """
+    Submuestrea un raster por saltos para que su lado mayor quede <= max_px.
+    Devuelve una vista (sin copia); la imagen se estira igual sobre los bounds.
+    """
+    paso = max(1, -(-max(arr.shape[:2]) // max_px))
+    return arr[::paso, ::paso]
+
+@functools.lru_cache(maxsize=16)
+def _lut_colormap(nombre):
+    """
+    Tabla (256, 3) uint8 con los colores RGB de un colormap de Matplotlib
+    """
+    import matplotlib
+    
+    colormap = matplotlib.colormaps[nombre].resampled(256)
+    return (colormap(np.arange(256))[:, :3] * 255).astype(np.uint8)
+
+@functools.lru_cache(maxsize=16)
+def _lut_hex(nombre):
+    """
+    Array (256,) con los colores '#rrggbb' de un colormap (256 formatos, una vez)
+    """
+    return np.array(['#%02x%02x%02x' % tuple(c) for c in _lut_colormap(nombre).tolist()])
+
+# Zona UTM norte (WGS84) en strings de CRS: "EPSG:32613", "UTM_ZONE_13N", "UTM zone 13N"
+_UTM_ZONA_RE = re.compile(r'EPSG:?326(\d{2})|UTM[ _]ZONE[ _](\d{1,2})N?', re.IGNORECASE)
+
+def _detectar_zona_utm(crs_string):
+    """
+    Zona UTM (hemisferio norte) contenida en un string de CRS, o None
+    """
+    match = _UTM_ZONA_RE.search(crs_string)
+    if match is None:
+        return None
+    return int(match.group(1) or match.group(2))
+
+@functools.lru_cache(maxsize=8)
+def _transformer_a_wgs84(epsg_origen):
+    """
+    Transformer de pyproj hacia WGS84, construido una sola vez por CRS de origen
+    """
+    from pyproj import Transformer
+    
+    return Transformer.from_crs(epsg_origen, "EPSG:4326", always_xy=True)
+
+@st.cache_data(show_spinner=False)
+def _calcular_bounds_mapa(minx, miny, maxx, maxy, crs_string, epsg=None):
+    """
+    Convierte bounds proyectados a bounds de Folium [[south, west], [north, east]].
+    Se cachea por (bounds, CRS) para no repetir el parseo del CRS ni las
+    transformaciones de esquinas en cada rerun de Streamlit.
+    Args:
+        epsg: código EPSG del CRS si se conoce (CRS.to_epsg()); si no, se
+              intenta deducir la zona UTM del texto del CRS
+    Retorna: bounds_list, center, aviso (mensaje para el usuario o None)
+    """
+    aviso = None
+    bounds_list = [[miny, minx], [maxy, maxx]]
+    center = [(miny + maxy) / 2, (minx + maxx) / 2]
+    
+    if epsg == 4326 or (epsg is None and '4326' in crs_string):
+        # Ya está en WGS84
+        return bounds_list, center, aviso
+    
+    try:
+        # Detectar EPSG del CRS (cualquier código, incluidas zonas UTM sur)
+        zona = None
+        if epsg is None:
+            zona = _detectar_zona_utm(crs_string)
+            if zona is None and 'UTM' in crs_string.upper():
+                # UTM sin zona explícita: Zone 13N (común en norte de México)
+                zona = 13
+        if epsg is not None:
+            epsg_origen = f"EPSG:{epsg}"
+        elif zona is not None:
+            epsg_origen = f"EPSG:326{zona:02d}"
+        else:
+            # Asumir WGS84 si no se puede determinar
+            aviso = f"CRS desconocido: {crs_string}, asumiendo coordenadas geográficas"
+            epsg_origen = None
+        
+        if epsg_origen:
+            transformer = _transformer_a_wgs84(epsg_origen)
+            # Transformar las esquinas suroeste y noreste en una sola llamada
+            (lon_sw, lon_ne), (lat_sw, lat_ne) = transformer.transform([minx, maxx], [miny, maxy])
+            
+            # Para Folium ImageOverlay: [[south, west], [north, east]]
+            bounds_list = [[lat_sw, lon_sw], [lat_ne, lon_ne]]
+            center = [(lat_sw + lat_ne) / 2, (lon_sw + lon_ne) / 2]
+    except Exception as e:
+        aviso = f"No se pudo transformar CRS: {e}. Asumiendo coordenadas ya están en grados."
+    
+    return bounds_list, center, aviso
+
+def obtener_bounds_mapa(pr):
+    """
+    Calcula bounds [[south, west], [north, east]] y centro de la escena en WGS84
+    sin construir ninguna imagen (para overlays que solo necesitan la ubicación).
+    Retorna: bounds, center
+    """
+    transform = pr.metadatos['transform']
+    height = pr.metadatos['height']
+    width = pr.metadatos['width']
+    crs = pr.metadatos['crs']
+    
+    # Calcular bounds en coordenadas proyectadas
+    minx = transform.c
+    maxy = transform.f
+    maxx = minx + (width * transform.a)
+    miny = maxy + (height * transform.e)
+    
+    # Convertir a lat/lon (cacheado por bounds + CRS entre reruns); el EPSG
+    # sale del objeto CRS, sin buscar subcadenas en su texto (un WKT UTM
+    # contiene "4326" de su CRS geográfico base)
+    epsg = crs.to_epsg() if hasattr(crs, 'to_epsg') else None
+    bounds_list, center, aviso = _calcular_bounds_mapa(minx, miny, maxx, maxy, str(crs), epsg)
+    if aviso:
+        st.warning(aviso)
+    
+    return bounds_list, center
+
+def _huella_array(arr):
+    """
+    Clave de caché de un array: forma, dtype y hash de todo su contenido
+    (una edición in situ o un array nuevo en la misma dirección cambian la
+    clave). Las imágenes para el mapa se cachean a partir de las bandas ya
+    submuestreadas, así que solo se hashean los píxeles que se dibujan.
+    """
+    return (arr.shape, arr.dtype.str,
+            hashlib.blake2b(memoryview(np.ascontiguousarray(arr)), digest_size=16).hexdigest())
+
+def _componer_rgba(r, g, b, percentile=2):
+    """
+    Normaliza tres bandas con percentiles y las compone en una imagen RGBA uint8
+    (transparente donde no hay datos)
+    """
+    # Submuestrear al tamaño útil del overlay
+    r = _submuestrear_overlay(r)
+    g = _submuestrear_overlay(g)
+    b = _submuestrear_overlay(b)
+    
+    # Crear máscara para datos válidos (eliminar áreas negras/NoData)
+    # Máscara donde todas las bandas tienen valores válidos y > 0 (un recorrido)
+    mask = mascara_rgb_valida(r, g, b)
+    
+    # Normalizar con percentiles para mejor contraste
+    # (escribe cada banda directo en su canal, sin apilar una copia RGB)
+    rgb_norm = np.zeros((*r.shape, 4), dtype=np.uint8)  # RGBA
+    for i, band in enumerate((r, g, b)):
+        # Válidos en float32: la partición de los percentiles mueve la mitad
+        # de bytes (el estiramiento ya trabaja en float32)
+        valid = band[mask].astype(np.float32, copy=False)
+        if len(valid) > 0:
+            # Ambos extremos en una sola partición
+            p_low, p_high = np.percentile(valid, [percentile, 100 - percentile])
+            # Resta, escala, recorte y paso a uint8 en un solo recorrido,
+            # directo en el canal (aritmética float32)
+            estirar_a_uint8(band, p_low, p_high, rgb_norm[:, :, i])
+    
+    # Canal alpha: transparente donde no hay datos
+    rgb_norm[:, :, 3] = _LUT_ALPHA[mask.view(np.uint8)]
+    
+    # DEBUG: Verificar dimensiones
+    print(f"🗺️  Array shapes: R={r.shape}, G={g.shape}, B={b.shape}")
+    
+    return rgb_norm
+
 def crear_rgb_para_mapa(pr, r_band='B4', g_band='B3', b_band='B2', percentile=2):
     """
     Crea imagen RGB normalizada para overlay en mapa.
     Retorna: imagen_array, bounds, center
     """
     try:
-        # Obtener bandas
-        r = pr.bandas[r_band]
-        g = pr.bandas[g_band]
-        b = pr.bandas[b_band]
-        
-        # Stack
-        rgb = np.dstack([r, g, b])
-        
-        # Crear máscara para datos válidos (eliminar áreas negras/NoData)
-        # Máscara donde todas las bandas tienen valores válidos y > 0
-        mask = (r > 0) & (g > 0) & (b > 0) & (~np.isnan(r)) & (~np.isnan(g)) & (~np.isnan(b))
-        
-        # Normalizar con percentiles para mejor contraste
-        rgb_norm = np.zeros((*rgb.shape[:2], 4), dtype=np.uint8)  # RGBA
-        for i in range(3):
-            band = rgb[:, :, i]
-            valid = band[mask]
-            if len(valid) > 0:
-                p_low = np.percentile(valid, percentile)
-                p_high = np.percentile(valid, 100 - percentile)
-                band_norm = np.clip((band - p_low) / (p_high - p_low) * 255, 0, 255)
-                rgb_norm[:, :, i] = band_norm.astype(np.uint8)
-        
-        # Canal alpha: transparente donde no hay datos
-        rgb_norm[:, :, 3] = (mask * 255).astype(np.uint8)
+        rgb_norm = _componer_rgba(pr.bandas[r_band], pr.bandas[g_band],
+                                  pr.bandas[b_band], percentile)
         
         # Obtener bounds geográficos desde metadatos
-        transform = pr.metadatos['transform']
-        height = pr.metadatos['height']
-        width = pr.metadatos['width']
-        crs = pr.metadatos['crs']
-        
-        # DEBUG: Verificar dimensiones
-        print(f"🗺️  Metadatos: width={width}, height={height}")
-        print(f"🗺️  Transform pixel size: a={transform.a}, e={transform.e}")
-        print(f"🗺️  Array shapes: R={r.shape}, G={g.shape}, B={b.shape}")
-        
-        # Calcular bounds en coordenadas proyectadas
-        minx = transform.c
-        maxy = transform.f
-        maxx = minx + (width * transform.a)
-        miny = maxy + (height * transform.e)
-        
-        # DEBUG: Imprimir bounds originales
-        print(f"🗺️  Bounds UTM: X=[{minx}, {maxx}], Y=[{miny}, {maxy}]")
-        print(f"🗺️  CRS: {crs}")
-        
-        # Convertir a lat/lon si es necesario
-        crs_string = str(crs)
-        if 'EPSG:4326' not in crs_string and '4326' not in crs_string:
-            try:
-                # Intentar con pyproj
-                from pyproj import Transformer
-                
-                # Detectar EPSG del CRS
-                if 'UTM' in crs_string or '32613' in crs_string:
-                    # UTM Zone 13N (común en norte de México)
-                    transformer = Transformer.from_crs("EPSG:32613", "EPSG:4326", always_xy=True)
-                elif '32612' in crs_string:
-                    transformer = Transformer.from_crs("EPSG:32612", "EPSG:4326", always_xy=True)
-                elif '32614' in crs_string:
-                    transformer = Transformer.from_crs("EPSG:32614", "EPSG:4326", always_xy=True)
-                else:
-                    # Asumir WGS84 si no se puede determinar
-                    st.warning(f"CRS desconocido: {crs_string}, asumiendo coordenadas geográficas")
-                    transformer = None
-                
-                if transformer:
-                    # Transformar las 4 esquinas correctamente
-                    # minx, miny = esquina inferior izquierda (suroeste)
-                    # maxx, maxy = esquina superior derecha (noreste)
-                    lon_sw, lat_sw = transformer.transform(minx, miny)  # Southwest
-                    lon_ne, lat_ne = transformer.transform(maxx, maxy)  # Northeast
-                    
-                    print(f"🗺️  Esquina SW: Lat={lat_sw:.4f}, Lon={lon_sw:.4f}")
-                    print(f"🗺️  Esquina NE: Lat={lat_ne:.4f}, Lon={lon_ne:.4f}")
-                    
-                    # Para Folium ImageOverlay: [[south, west], [north, east]]
-                    bounds_list = [[lat_sw, lon_sw], [lat_ne, lon_ne]]
-                    center = [(lat_sw + lat_ne) / 2, (lon_sw + lon_ne) / 2]
-                else:
-                    # Ya está en coordenadas geográficas
-                    bounds_list = [[miny, minx], [maxy, maxx]]
-                    center = [(miny + maxy) / 2, (minx + maxx) / 2]
-            except Exception as e:
-                st.warning(f"No se pudo transformar CRS: {e}. Asumiendo coordenadas ya están en grados.")
-                bounds_list = [[miny, minx], [maxy, maxx]]
-                center = [(miny + maxy) / 2, (minx + maxx) / 2]
-        else:
-            # Ya está en WGS84
-            bounds_list = [[miny, minx], [maxy, maxx]]
-            center = [(miny + maxy) / 2, (minx + maxx) / 2]
+        bounds_list, center = obtener_bounds_mapa(pr)
         
         return rgb_norm, bounds_list, center
     except Exception as e:
         st.error(f"Error creating RGB: {e}")
-        import traceback
         st.error(traceback.format_exc())
         return None, None, None
 
-def array_to_png_base64(array):
+@st.cache_data(show_spinner=False, max_entries=32, hash_funcs={np.ndarray: _huella_array})
+def _rgb_overlay_cacheado(r, g, b, percentile):
+    """
+    Composición RGB codificada, cacheada por huella de las bandas: los
+    reruns que no cambian datos reutilizan la imagen ya codificada.
+    """
+    return _codificar_imagen(_componer_rgba(r, g, b, percentile))
+
+def crear_rgb_overlay(r, g, b, percentile=2):
+    """
+    Composición RGB lista para folium ImageOverlay (bytes, mime). Las bandas
+    entran a la caché ya submuestreadas (la imagen solo depende de esos
+    píxeles).
     """
-    Convierte array numpy a PNG en base64 para folium ImageOverlay
+    return _rgb_overlay_cacheado(_submuestrear_overlay(r), _submuestrear_overlay(g),
+                                 _submuestrear_overlay(b), percentile)
+
+def _codificar_imagen(array):
+    """
+    Codifica un array numpy como imagen para folium ImageOverlay.
     
     IMPORTANTE: Folium espera que la imagen tenga el origen en la esquina
     superior izquierda correspondiendo al norte-oeste geográfico.
     Los arrays de rasterio ya vienen así (fila 0 = norte), así que NO voltear.
+    
+    Acepta arrays 2D (escala de grises), RGB o RGBA. Se codifica como WebP con
+    pérdida (CALIDAD_WEBP, codificador más rápido) si Pillow lo soporta: es
+    solo visualización y pesa varias veces menos que PNG o WebP sin pérdida;
+    si no, como PNG con compresión rápida.
+    Retorna: bytes, mime
     """
     # DEBUG: Imprimir dimensiones
     print(f"🖼️  Array shape para PNG: {array.shape}")
     
-    # Detectar si es RGB o RGBA
-    if array.shape[2] == 4:
+    # Detectar si es escala de grises, RGB o RGBA
+    if array.ndim == 2:
+        img = Image.fromarray(array, mode='L')
+    elif array.shape[2] == 4:
         img = Image.fromarray(array, mode='RGBA')
     else:
         img = Image.fromarray(array, mode='RGB')
     
     buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    img_base64 = base64.b64encode(buffer.read()).decode()
-    return f"data:image/png;base64,{img_base64}"
+    if WEBP_AVAILABLE:
+        img.save(buffer, format='WEBP', quality=CALIDAD_WEBP, method=0)
+        mime = 'image/webp'
+    else:
+        img.save(buffer, format='PNG', compress_level=1)
+        mime = 'image/png'
+    return buffer.getvalue(), mime
+
+def array_to_png_base64(array):
+    """
+    Convierte array numpy a imagen en base64 (data URI) para folium ImageOverlay
+    """
+    datos, mime = _codificar_imagen(array)
+    img_base64 = base64.b64encode(datos).decode()
+    return f"data:{mime};base64,{img_base64}"
 
+def _publicar_overlay(datos, mime):
+    """
+    Guarda la imagen en app/static/overlays con el hash del contenido como
+    nombre y retorna la URL con la que Streamlit la sirve. Imágenes idénticas
+    reutilizan el mismo archivo y el navegador las toma de su caché HTTP.
+    """
+    nombre = hashlib.blake2b(datos, digest_size=16).hexdigest() + '.' + mime.split('/')[1]
+    ruta = OVERLAY_STATIC_DIR / nombre
+    if not ruta.exists():
+        OVERLAY_STATIC_DIR.mkdir(parents=True, exist_ok=True)
+        ruta.write_bytes(datos)
+        
+        # Conservar solo los overlays más recientes
+        archivos = sorted(OVERLAY_STATIC_DIR.iterdir(), key=lambda f: f.stat().st_mtime)
+        for viejo in archivos[:-MAX_OVERLAYS_ESTATICOS]:
+            viejo.unlink(missing_ok=True)
+    
+    base_url = (st.get_option('server.baseUrlPath') or '').strip('/')
+    prefijo = f"/{base_url}" if base_url else ''
+    return f"{prefijo}/app/static/overlays/{nombre}"
+
+def fuente_overlay(imagen):
+    """
+    Fuente de imagen para ImageOverlay a partir de (bytes, mime): URL de
+    archivo estático si Streamlit tiene activado server.enableStaticServing
+    (la imagen no viaja dentro del HTML del mapa en cada rerun); si no, data
+    URI en base64.
+    
+    Se resuelve en cada rerun y no se cachea: si el archivo estático fue
+    borrado al podar app/static/overlays, se vuelve a escribir.
+    """
+    datos, mime = imagen
+    if st.get_option('server.enableStaticServing'):
+        return _publicar_overlay(datos, mime)
+    return f"data:{mime};base64,{base64.b64encode(datos).decode()}"
+
+def agregar_image_overlay(m, imagen, bounds, opacity, name):
+    """
+    Agrega un ImageOverlay al mapa a partir de la imagen codificada (bytes, mime)
+    """
+    imagen = fuente_overlay(imagen)
+    overlay = folium.raster_layers.ImageOverlay(
+        image=imagen if imagen.startswith('data:') else 'data:,',
+        bounds=bounds, opacity=opacity,
+        name=name, interactive=False, cross_origin=False
+    )
+    if not imagen.startswith('data:'):
+        # Folium trataría una ruta sin esquema como archivo local a incrustar
+        overlay.url = imagen
+    overlay.add_to(m)
+    return overlay
+
+def overlay_memorizado(capa, array, generar):
+    """
+    Reutiliza la imagen (o capa) ya generada mientras su dato de origen sea
+    el mismo objeto; evita normalizar, codificar y hashear en cada rerun.
+    
+    Args:
+        capa: Nombre de la capa (clave en st.session_state.overlays)
+        array: Array (u objeto) de origen de la capa
+        generar: Función sin argumentos que produce la imagen o capa
+    
+    Returns:
+        Imagen codificada (bytes, mime) o lo que retorne generar
+    """
+    previo = st.session_state.overlays.get(capa)
+    # Se guarda el propio array (no su id) para que un id reciclado no dé falso acierto
+    if previo is not None and previo[0] is array:
+        return previo[1]
+    imagen = generar()
+    st.session_state.overlays[capa] = (array, imagen)
+    return imagen
+
+# Colormap de cada índice espectral (overlays y vistas previas)
+CMAPS_INDICES = {
+    'gossan': 'RdYlBu_r',
+    'oxidos': 'OrRd',
+    'argilica': 'YlOrBr',
+    'propilitica': 'YlGn',
+    'carbonatos': 'Greys',
+    'clay': 'PuRd',
+    'ndvi': 'RdYlGn'
+}
+
+# Índices espectrales: clave -> (método de TerrafPR, dict de resultados en pr)
+CALCULOS_INDICES = {
+    'gossan': ('calcular_gossan', 'indices'),
+    'oxidos': ('calcular_ratio_oxidos', 'ratios'),
+    'argilica': ('calcular_ratio_argilica', 'ratios'),
+    'propilitica': ('calcular_propilitica', 'indices'),
+    'carbonatos': ('calcular_carbonatos', 'indices'),
+    'clay': ('calcular_clay_index', 'indices'),
+    'ndvi': ('calcular_ndvi', 'indices')
+}
+
+def _colorear_indice(index_data, cmap, max_px=MAX_PX_OVERLAY):
+    """
+    Índice -> imagen RGBA uint8 con colormap (estirado 2-98 %), transparente
+    donde no hay datos. Retorna None si no hay valores válidos.
+    """
+    # Submuestrear antes de percentiles/colormap/PNG
+    index_data = _submuestrear_overlay(index_data, max_px)
+    
+    # Máscara de datos válidos: una sola pasada, reutilizada para el alpha
+    finitos = np.isfinite(index_data)
+    valid = index_data[finitos].astype(np.float32, copy=False)
+    if len(valid) == 0:
+        return None
+    
+    # Normalizar datos en float32 directamente a índices 0-255 del colormap
+    vmin, vmax = np.percentile(valid, [2, 98])
+    escala = 256.0 / (vmax - vmin) if vmax > vmin else 256.0
+    norm_data = np.subtract(index_data, vmin, dtype=np.float32)
+    norm_data *= escala
+    np.clip(norm_data, 0, 255, out=norm_data)
+    np.nan_to_num(norm_data, copy=False)
+    
+    # Aplicar colormap como tabla de 256 colores (sin RGBA float64 intermedio)
+    rgba_final = np.empty((*index_data.shape, 4), dtype=np.uint8)
+    rgba_final[:, :, :3] = _lut_colormap(cmap)[norm_data.astype(np.uint8)]
+    
+    # Aplicar transparencia a NaN
+    rgba_final[:, :, 3] = _LUT_ALPHA[finitos.view(np.uint8)]
+    return rgba_final
+
+@st.cache_data(show_spinner=False, max_entries=32, hash_funcs={np.ndarray: _huella_array})
 def crear_index_para_mapa(index_data, bounds, cmap='RdYlGn'):
     """
     Crea visualización de índice con colormap para el mapa
-    Retorna: imagen_array en base64
+    Retorna: imagen codificada (bytes, mime), cacheada por huella del índice y colormap
     """
     try:
-        # Normalizar datos
-        valid = index_data[~np.isnan(index_data)]
-        if len(valid) == 0:
+        rgba_final = _colorear_indice(index_data, cmap)
+        if rgba_final is None:
             return None
         
-        vmin, vmax = np.percentile(valid, [2, 98])
-        norm_data = np.clip((index_data - vmin) / (vmax - vmin), 0, 1)
+        # Convertir a imagen
+        return _codificar_imagen(rgba_final)
+    except Exception as e:
+        st.error(f"Error creating index visualization: {e}")
+        return None
+
+@st.cache_data(show_spinner=False, max_entries=32, hash_funcs={np.ndarray: _huella_array})
+def vista_previa_indice(index_data, cmap, max_px=400):
+    """
+    Miniatura de un índice con su colormap, ya codificada (bytes para
+    st.image), sin pasar por una figura de Matplotlib.
+    """
+    rgba = _colorear_indice(index_data, cmap, max_px)
+    if rgba is None:
+        return None
+    return _codificar_imagen(rgba)[0]
+
+@st.cache_resource(show_spinner=False)
+def _crear_mapa_base(center, zoom, basemap):
+    """
+    Construye la parte estática del mapa: basemap, controles y herramienta de
+    dibujo. Se cachea por (centro, zoom, basemap); quien lo use debe trabajar
+    sobre una copia (copy.deepcopy) para no acumular overlays en el objeto
+    cacheado.
+    """
+    # Crear mapa base
+    m = folium.Map(
+        location=list(center),
+        zoom_start=zoom,
+        tiles=None  # No default tile
+    )
+    
+    # Agregar basemap según selección
+    if basemap == "OpenStreetMap":
+        folium.TileLayer('OpenStreetMap', name='OpenStreetMap').add_to(m)
+    elif basemap == "Satellite":
+        folium.TileLayer(
+            tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
+            attr='ESRI World Imagery',
+            name='Satellite'
+        ).add_to(m)
+    elif basemap == "Topographic":
+        folium.TileLayer(
+            tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Topo_Map/MapServer/tile/{z}/{y}/{x}',
+            attr='ESRI Topographic',
+            name='Topographic'
+        ).add_to(m)
+    
+    # Controles del mapa
+    folium.plugins.MeasureControl(position='topleft').add_to(m)
+    folium.plugins.Fullscreen(position='topleft').add_to(m)
+    folium.plugins.MousePosition().add_to(m)
+    
+    # Herramienta de dibujo para definir área de interés
+    draw = folium.plugins.Draw(
+        export=True,
+        position='topleft',
+        draw_options={
+            'polyline': False,
+            'circle': False,
+            'circlemarker': False,
+            'marker': False,
+            'polygon': {
+                'allowIntersection': False,
+                'shapeOptions': {
+                    'color': '#00ff00',
+                    'weight': 3,
+                    'fillOpacity': 0.2
+                }
+            },
+            'rectangle': {
+                'shapeOptions': {
+                    'color': '#00ff00',
+                    'weight': 3,
+                    'fillOpacity': 0.2
+                }
+            }
+        }
+    )
+    draw.add_to(m)
+    
+    return m
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def cargar_escena_landsat(scene_path, reducir=True, factor=4):
+    """
+    Carga (una sola vez por ruta y opciones) las bandas de una escena local.
+    Volver a cargar la misma escena reutiliza el TerrafPR ya en memoria, con
+    los índices que ya se hayan calculado sobre él.
+    Retorna: TerrafPR con bandas cargadas
+    """
+    pr = TerrafPR(str(scene_path))
+    pr.cargar_bandas(reducir=reducir, factor=factor)
+    return pr
+
+@st.cache_data(ttl=60, show_spinner=False)
+def buscar_escenas_locales(search_dirs):
+    """
+    Busca escenas Landsat (carpetas con TIF) y HLS (archivos sueltos) en los
+    directorios dados. Cacheada unos segundos para no recorrer el disco en
+    cada rerun; se invalida con buscar_escenas_locales.clear().
+    Retorna: all_scenes (nombres a mostrar), scene_paths (nombre -> Path)
+    """
+    all_scenes = []
+    scene_paths = {}  # Mapear nombre -> path completo
+    
+    for base_dir in map(Path, search_dirs):
+        if not base_dir.exists():
+            continue
+        
+        # Un solo recorrido con os.walk (os.scandir: tipo de entrada sin stat extra)
+        archivos_raiz = []
+        for dirpath, _, filenames in os.walk(base_dir):
+            item = Path(dirpath)
+            if item == base_dir:
+                archivos_raiz = filenames
+                continue
+            # Solo agregar si tiene archivos TIF (evitar carpetas vacías)
+            if any(f.endswith(('.TIF', '.tif')) for f in filenames):
+                scene_name = item.name
+                # Agregar etiqueta de ubicación
+                if "downloaded" in dirpath:
+                    display_name = f"📥 {scene_name}"
+                else:
+                    display_name = f"📂 {scene_name}"
+                all_scenes.append(display_name)
+                scene_paths[display_name] = item
         
-        # Aplicar colormap
-        from matplotlib import cm
-        colormap = cm.get_cmap(cmap)
-        rgba = colormap(norm_data)
+        # Buscar archivos HLS
+        hls_scenes = set()
+        for nombre in archivos_raiz:
+            if not nombre.endswith('.tif'):
+                continue
+            parts = nombre[:-len('.tif')].split('.')
+            if len(parts) >= 4:
+                scene_id = '.'.join(parts[:4])
+                display_name = f"🌐 {scene_id}"
+                hls_scenes.add(display_name)
+                scene_paths[display_name] = base_dir
+        all_scenes.extend(list(hls_scenes))
+    
+    return all_scenes, scene_paths
+
+def buscar_shapefiles(directorio):
+    """
+    Lista los shapefiles (.shp) bajo un directorio
+    """
+    return list(Path(directorio).rglob("*.shp"))
+
+@st.cache_resource(show_spinner=False)
+def _ejecutor_busquedas():
+    """
+    Hilo compartido para búsquedas en disco que no deben bloquear el render
+    """
+    return ThreadPoolExecutor(max_workers=2)
+
+def shapefiles_en_segundo_plano(directorio, ttl=60):
+    """
+    Lista de shapefiles sin bloquear el script: buscar_shapefiles corre en un
+    hilo y su resultado se recoge en un rerun posterior (en discos lentos o de
+    red la interfaz y el mapa se dibujan sin esperar el recorrido). La
+    búsqueda se repite como mucho cada `ttl` segundos.
+    Retorna: lista de rutas de la última búsqueda terminada, o None si la
+    primera aún está en curso
+    """
+    busquedas = st.session_state.setdefault('busquedas_shp', {})
+    futuro, inicio, ultima = busquedas.get(directorio, (None, 0.0, None))
+    
+    if futuro is not None and futuro.done():
+        ultima = futuro.result()
+        futuro = None
+    if futuro is None and (ultima is None or time.monotonic() - inicio > ttl):
+        futuro = _ejecutor_busquedas().submit(buscar_shapefiles, directorio)
+        inicio = time.monotonic()
+    
+    busquedas[directorio] = (futuro, inicio, ultima)
+    return ultima
+
+def leer_shapefile_mag(shp_path, bloque=200_000, progreso=None):
+    """
+    Lee un shapefile de magnetometría. Con pyogrio la tabla de atributos y
+    las geometrías (WKB) llegan en arrays, por bloques de `bloque` features,
+    y los centroides se calculan vectorizados con shapely; sin pyogrio se
+    recorre el archivo feature por feature con fiona.
+    Las geometrías se devuelven como array de shapely (no como dicts GeoJSON):
+    el mapa solo convierte las que dibuja.
+    Args:
+        progreso: callable opcional que recibe la fracción leída (0-1)
+    Retorna: geometrias (array de shapely), df (atributos), crs, (x, y) centroides
+    """
+    try:
+        import pyogrio
+        import shapely
+    except ImportError:
+        pyogrio = None
+    
+    if pyogrio is not None:
+        info = pyogrio.read_info(str(shp_path))
+        n_total = info['features']
         
-        # Convertir a RGB uint8
-        rgb = (rgba[:, :, :3] * 255).astype(np.uint8)
+        # Si el esquema ya indica la columna de campo magnético, leer solo esa
+        # (los shapefiles del SGM traen decenas de atributos que no se usan);
+        # si no, todas, para que el usuario elija la columna
+        campo = TerrafMag.detectar_columna_campo(info['fields'], [np.dtype(d) for d in info['dtypes']])
+        columnas_leer = [campo] if campo is not None else None
+        columnas = None
+        coords = (np.empty(n_total), np.empty(n_total))
+        geometrias = np.empty(n_total, dtype=object)
+        crs_info = None
         
-        # Aplicar transparencia a NaN
-        alpha = (~np.isnan(index_data)).astype(np.uint8) * 255
-        rgba_final = np.dstack([rgb, alpha])
+        # Un bloque a la vez: el WKB y las geometrías de cada bloque se
+        # liberan antes de leer el siguiente; las columnas y centroides se
+        # copian a arrays preasignados (sin concat al final)
+        for inicio in range(0, n_total, bloque):
+            meta, _, wkb, campos = pyogrio.raw.read(str(shp_path), columns=columnas_leer,
+                                                   skip_features=inicio, max_features=bloque,
+                                                   datetime_as_string=True)
+            fin = inicio + len(wkb)
+            crs_info = meta['crs']
+            if columnas is None:
+                columnas = {nombre: np.empty(n_total, dtype=valores.dtype)
+                            for nombre, valores in zip(meta['fields'], campos)}
+            for nombre, valores in zip(meta['fields'], campos):
+                columnas[nombre][inicio:fin] = valores
+            
+            geometrias[inicio:fin] = shapely.from_wkb(wkb)
+            centroides = shapely.centroid(geometrias[inicio:fin])
+            coords[0][inicio:fin] = shapely.get_x(centroides)
+            coords[1][inicio:fin] = shapely.get_y(centroides)
+            
+            if progreso is not None:
+                progreso(fin / n_total)
         
-        # Convertir a imagen
-        img = Image.fromarray(rgba_final, mode='RGBA')
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        img_base64 = base64.b64encode(buffer.read()).decode()
+        if columnas is None:
+            # Shapefile sin features: solo esquema y CRS
+            meta, _, _, campos = pyogrio.raw.read(str(shp_path), columns=columnas_leer,
+                                                 datetime_as_string=True)
+            crs_info = meta['crs']
+            columnas = dict(zip(meta['fields'], campos))
         
-        return f"data:image/png;base64,{img_base64}"
-    except Exception as e:
-        st.error(f"Error creating index visualization: {e}")
-        return None
+        return geometrias, pd.DataFrame(columnas), crs_info, coords
+    
+    import fiona  # solo se necesita al cargar shapefiles
+    import shapely
+    from shapely.geometry import shape
+    with fiona.open(str(shp_path), 'r') as src:
+        crs_info = src.crs
+        esquema = src.schema['properties']
+        features = list(src)
+    
+    # DataFrame con columnas tipadas desde el esquema OGR ('float:24.15',
+    # 'int:9', 'str:80'...), sin que pandas infiera el tipo registro por registro
+    n = len(features)
+    columnas = {}
+    for campo, tipo in esquema.items():
+        valores = (f['properties'][campo] for f in features)
+        if tipo.split(':')[0] in ('float', 'int', 'int32', 'int64'):
+            col = np.fromiter((np.nan if v is None else v for v in valores),
+                              dtype=np.float64, count=n)
+            # Enteros sin nulos quedan int64 (con nulos, float64 con NaN)
+            if not tipo.startswith('float') and not np.isnan(col).any():
+                col = col.astype(np.int64)
+        else:
+            col = np.fromiter(valores, dtype=object, count=n)
+        columnas[campo] = col
+    df = pd.DataFrame(columnas)
+    
+    # Centroides de las geometrías para el cache de coordenadas de TerrafMag
+    geometrias = np.empty(n, dtype=object)
+    geometrias[:] = [shape(f['geometry']) for f in features]
+    centroides = shapely.centroid(geometrias)
+    coords = (shapely.get_x(centroides), shapely.get_y(centroides))
+    return geometrias, df, crs_info, coords
+
+def _mtime_shapefile(shp_path):
+    """
+    Última modificación entre los archivos del shapefile (.shp, .dbf, .prj...)
+    """
+    shp_path = Path(shp_path)
+    return max(p.stat().st_mtime for p in shp_path.parent.glob(f"{glob.escape(shp_path.stem)}.*"))
+
+@st.cache_data(show_spinner=False, max_entries=4, persist="disk")
+def cargar_shapefile_mag(ruta, mtime):
+    """
+    leer_shapefile_mag cacheada por ruta + fecha de modificación: volver a
+    cargar el mismo archivo no lo relee (cambia mtime -> se relee). El
+    resultado se guarda también en disco (caché de Streamlit), así que sobrevive
+    a reinicios de la app: cargarlo es varias veces más rápido que parsear el
+    shapefile.
+    Sin barra de progreso: un elemento creado fuera de la función no puede
+    usarse dentro (Streamlit reproduce esas llamadas en cada acierto de caché);
+    quien la llama muestra un spinner.
+    Retorna: lo mismo que leer_shapefile_mag
+    """
+    return leer_shapefile_mag(ruta)
+
+def resumen_array(data, bins=30, columna='Freq'):
+    """
+    Estadísticas e histograma de un array ignorando NaN/inf, calculados
+    juntos por resumen_histograma (terraf_utils); incluye ya armado el
+    DataFrame del histograma (columna = etiqueta de la serie en st.bar_chart).
+    Sin caché: una huella exacta del raster completo cuesta más que este
+    recorrido.
+    Retorna: dict con min, max, mean, std, counts, edges, hist
+    """
+    resumen = resumen_histograma(data, bins)
+    resumen['hist'] = histograma_df(resumen, columna)
+    return resumen
+
+def histograma_df(resumen, columna='Freq'):
+    """
+    DataFrame (centro de bin -> conteo) para st.bar_chart a partir de resumen_array
+    """
+    edges = resumen['edges']
+    centros = np.round((edges[:-1] + edges[1:]) / 2, 4)
+    return pd.DataFrame({columna: resumen['counts']}, index=pd.Index(centros, name='Value'))
+
 # ============================================================================
 # SESSION STATE - PERSISTENTE
 # ============================================================================
@@ -299,6 +844,8 @@ if 'mag_data' not in st.session_state:
     st.session_state.mag_data = None
 if 'indices' not in st.session_state:
     st.session_state.indices = {}
+if 'overlays' not in st.session_state:
+    st.session_state.overlays = {}  # capa -> (array de origen, imagen)
 if 'prevent_rerun' not in st.session_state:
     st.session_state.prevent_rerun = False
 if 'map_rendered' not in st.session_state:
@@ -402,40 +949,8 @@ with st.sidebar:
                     Path("datos/downloaded")
                 ]
             
-            all_scenes = []
-            scene_paths = {}  # Mapear nombre -> path completo
-            
-            for base_dir in search_dirs:
-                if not base_dir.exists():
-                    continue
-                
-                # Buscar subdirectorios con archivos TIF
-                for item in base_dir.rglob("*"):
-                    if item.is_dir():
-                        tif_files = list(item.glob("*.TIF")) + list(item.glob("*.tif"))
-                        # Solo agregar si tiene archivos TIF (evitar carpetas vacías)
-                        if tif_files and len(tif_files) > 0:
-                            scene_name = item.name
-                            # Agregar etiqueta de ubicación
-                            if "downloaded" in str(item):
-                                display_name = f"📥 {scene_name}"
-                            else:
-                                display_name = f"📂 {scene_name}"
-                            all_scenes.append(display_name)
-                            scene_paths[display_name] = item
-                
-                # Buscar archivos HLS
-                hls_files = list(base_dir.glob("*.tif"))
-                if hls_files:
-                    hls_scenes = set()
-                    for f in hls_files:
-                        parts = f.stem.split('.')
-                        if len(parts) >= 4:
-                            scene_id = '.'.join(parts[:4])
-                            display_name = f"🌐 {scene_id}"
-                            hls_scenes.add(display_name)
-                            scene_paths[display_name] = base_dir
-                    all_scenes.extend(list(hls_scenes))
+            # Escaneo de directorios cacheado (no recorrer el disco en cada rerun)
+            all_scenes, scene_paths = buscar_escenas_locales(tuple(str(d) for d in search_dirs))
             
             if not all_scenes:
                 st.info("📂 No local scenes found in datos/landsat9 or datos/downloaded")
@@ -448,12 +963,14 @@ with st.sidebar:
                 if st.button("📂 Load Local Scene", type="primary", key="load_landsat_btn"):
                     with st.spinner("Loading Landsat data..."):
                         try:
-                            # Usar el path que ya encontramos
+                            # Usar el path que ya encontramos; el escaneo está
+                            # cacheado, así que validar con un solo stat antes de
+                            # que cargar_bandas() falle a mitad de la lectura
                             scene_path = selected_scene_path
+                            os.stat(scene_path)
                             
-                            # Cargar escena
-                            pr = TerrafPR(str(scene_path))
-                            pr.cargar_bandas(reducir=True, factor=4)
+                            # Cargar escena (cacheada por ruta + opciones)
+                            pr = cargar_escena_landsat(str(scene_path), reducir=True, factor=4)
                             st.session_state.landsat_data = pr
                             st.session_state.landsat_scene_name = selected_scene
                             st.success(f"✅ Loaded {len(pr.bandas)} bands")
@@ -467,12 +984,15 @@ with st.sidebar:
                             
                             st.rerun()
                             
+                        except FileNotFoundError:
+                            # La escena desapareció desde el último escaneo
+                            buscar_escenas_locales.clear()
+                            st.error(f"❌ Scene not found: {scene_path}")
                         except ValueError as e:
                             st.error(f"❌ Format Error: {str(e)[:200]}")
                             st.info("💡 Supported formats:\n- Landsat Level-1: *_B*.TIF\n- Landsat Level-2: *_SR_B*.TIF\n- HLS: HLS.L30.*.B*.tif")
                         except Exception as e:
                             st.error(f"❌ Error: {str(e)[:200]}")
-                            import traceback
                             st.code(traceback.format_exc()[:500])
         
             with tab2:
@@ -496,7 +1016,6 @@ with st.sidebar:
                     with st.spinner("Processing uploaded files..."):
                         try:
                             # Crear directorio temporal para los archivos
-                            import tempfile
                             temp_dir = Path(tempfile.mkdtemp())
                             
                             # Guardar archivos subidos
@@ -524,12 +1043,10 @@ with st.sidebar:
                         except ValueError as e:
                             st.error(f"❌ Format Error: {str(e)[:200]}")
                             st.info("💡 Supported formats:\n- Landsat Level-1: *_B*.TIF\n- Landsat Level-2: *_SR_B*.TIF\n- HLS: HLS.L30.*.B*.tif")
-                            import traceback
                             with st.expander("Ver detalles del error"):
                                 st.code(traceback.format_exc())
                         except Exception as e:
                             st.error(f"❌ Error: {str(e)[:200]}")
-                            import traceback
                             with st.expander("Ver detalles del error"):
                                 st.code(traceback.format_exc())
     # ========================================================================
@@ -555,27 +1072,9 @@ with st.sidebar:
                 if st.button(f"Calculate {display_name}", key=f"calc_{key}"):
                     with st.spinner(f"Calculating {display_name}..."):
                         try:
-                            if key == 'gossan':
-                                pr.calcular_gossan()
-                                st.session_state.indices['gossan'] = pr.indices['gossan']
-                            elif key == 'oxidos':
-                                pr.calcular_ratio_oxidos()
-                                st.session_state.indices['oxidos'] = pr.ratios['oxidos']
-                            elif key == 'argilica':
-                                pr.calcular_ratio_argilica()
-                                st.session_state.indices['argilica'] = pr.ratios['argilica']
-                            elif key == 'propilitica':
-                                pr.calcular_propilitica()
-                                st.session_state.indices['propilitica'] = pr.indices['propilitica']
-                            elif key == 'carbonatos':
-                                pr.calcular_carbonatos()
-                                st.session_state.indices['carbonatos'] = pr.indices['carbonatos']
-                            elif key == 'clay':
-                                pr.calcular_clay_index()
-                                st.session_state.indices['clay'] = pr.indices['clay']
-                            elif key == 'ndvi':
-                                pr.calcular_ndvi()
-                                st.session_state.indices['ndvi'] = pr.indices['ndvi']
+                            metodo, resultados = CALCULOS_INDICES[key]
+                            getattr(pr, metodo)()
+                            st.session_state.indices[key] = getattr(pr, resultados)[key]
                             
                             st.success(f"✅ {display_name} calculated")
                             st.session_state.landsat_data = pr
@@ -604,9 +1103,12 @@ with st.sidebar:
             with tab1:
                 mag_dir = Path("datos/magnetometria")
                 if mag_dir.exists():
-                    shapefiles = list(mag_dir.rglob("*.shp"))
+                    shapefiles = shapefiles_en_segundo_plano(str(mag_dir))
                     
-                    if shapefiles:
+                    if shapefiles is None:
+                        st.info("🔍 Searching for shapefiles...")
+                        st.button("🔄 Refresh", key="refresh_shp_search")
+                    elif shapefiles:
                         shp_names = [f.name for f in shapefiles]
                         selected_shp = st.selectbox("Select shapefile", shp_names, key="local_mag_select")
                         
@@ -615,17 +1117,11 @@ with st.sidebar:
                                 try:
                                     shp_path = [f for f in shapefiles if f.name == selected_shp][0]
                                     
-                                    # Cargar features con fiona (siempre funciona)
-                                    features = []
-                                    crs_info = None
-                                    with fiona.open(str(shp_path), 'r') as src:
-                                        crs_info = src.crs
-                                        for feature in src:
-                                            features.append(feature)
-                                    
-                                    # Extraer propiedades para DataFrame
-                                    records = [f['properties'] for f in features]
-                                    df = pd.DataFrame(records)
+                                    # Cargar geometrías, atributos y centroides (cacheado; el
+                                    # spinner de arriba cubre la lectura)
+                                    geometrias, df, crs_info, coords = cargar_shapefile_mag(
+                                        str(shp_path), _mtime_shapefile(shp_path)
+                                    )
                                     
                                     # Crear TerrafMag
                                     mag = TerrafMag(dataframe=df)
@@ -634,18 +1130,8 @@ with st.sidebar:
                                     # Activar capa de magnetometría automáticamente
                                     st.session_state.active_layers['magnetometry'] = True
                                     
-                                    # Extraer coordenadas de geometrías para cache
-                                    from shapely.geometry import shape
-                                    coords_x = []
-                                    coords_y = []
-                                    for feature in features:
-                                        geom = shape(feature['geometry'])
-                                        centroid = geom.centroid
-                                        coords_x.append(centroid.x)
-                                        coords_y.append(centroid.y)
-                                    
                                     # Guardar coordenadas en cache de TerrafMag
-                                    mag._coords_cache = (np.array(coords_x), np.array(coords_y))
+                                    mag._coords_cache = coords
                                     
                                     # Guardar CRS
                                     mag._crs_info = crs_info
@@ -654,10 +1140,10 @@ with st.sidebar:
                                         numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
                                         mag_col = st.selectbox("Select magnetic column", numeric_cols)
                                         if st.button("Confirm", key="confirm_mag_col"):
-                                            mag.campo_total = df[mag_col].values
+                                            mag.asignar_campo(mag_col)
                                             st.session_state.mag_data = {
                                                 'mag': mag,
-                                                'features': features,
+                                                'geometrias': geometrias,
                                                 'df': df,
                                                 'crs': crs_info
                                             }
@@ -665,11 +1151,11 @@ with st.sidebar:
                                     else:
                                         st.session_state.mag_data = {
                                             'mag': mag,
-                                            'features': features,
+                                            'geometrias': geometrias,
                                             'df': df,
                                             'crs': crs_info
                                         }
-                                        st.success(f"✅ {len(features)} features loaded | Campo: {mag.campo_total.min():.1f} - {mag.campo_total.max():.1f} nT")
+                                        st.success(f"✅ {len(geometrias)} features loaded | Campo: {mag.estadisticas.get('min', np.nan):.1f} - {mag.estadisticas.get('max', np.nan):.1f} nT")
                                         
                                 except Exception as e:
                                     st.error(f"❌ Error: {e}")
@@ -693,7 +1179,6 @@ with st.sidebar:
                     with st.spinner("Processing uploaded shapefile..."):
                         try:
                             # Crear directorio temporal
-                            import tempfile
                             temp_dir = Path(tempfile.mkdtemp())
                             
                             # Guardar archivos con el mismo nombre base
@@ -714,34 +1199,17 @@ with st.sidebar:
                                 with open(prj_path, "wb") as f:
                                     f.write(uploaded_prj.getbuffer())
                             
-                            # Cargar features con fiona
-                            features = []
-                            crs_info = None
-                            with fiona.open(str(shp_path), 'r') as src:
-                                crs_info = src.crs
-                                for feature in src:
-                                    features.append(feature)
-                            
-                            # Extraer propiedades para DataFrame
-                            records = [f['properties'] for f in features]
-                            df = pd.DataFrame(records)
+                            # Cargar geometrías, atributos y centroides (con progreso por bloques)
+                            barra = st.progress(0.0)
+                            geometrias, df, crs_info, coords = leer_shapefile_mag(shp_path, progreso=barra.progress)
+                            barra.empty()
                             
                             # Crear TerrafMag
                             mag = TerrafMag(dataframe=df)
                             mag._detectar_columnas()
                             
-                            # Extraer coordenadas de geometrías para cache
-                            from shapely.geometry import shape
-                            coords_x = []
-                            coords_y = []
-                            for feature in features:
-                                geom = shape(feature['geometry'])
-                                centroid = geom.centroid
-                                coords_x.append(centroid.x)
-                                coords_y.append(centroid.y)
-                            
                             # Guardar coordenadas en cache de TerrafMag
-                            mag._coords_cache = (np.array(coords_x), np.array(coords_y))
+                            mag._coords_cache = coords
                             
                             # Guardar CRS
                             mag._crs_info = crs_info
@@ -751,10 +1219,10 @@ with st.sidebar:
                                 numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
                                 mag_col = st.selectbox("Select magnetic column", numeric_cols, key="uploaded_mag_col")
                                 if st.button("Confirm Column", key="confirm_uploaded_mag_col"):
-                                    mag.campo_total = df[mag_col].values
+                                    mag.asignar_campo(mag_col)
                                     st.session_state.mag_data = {
                                         'mag': mag,
-                                        'features': features,
+                                        'geometrias': geometrias,
                                         'df': df,
                                         'crs': crs_info
                                     }
@@ -763,18 +1231,17 @@ with st.sidebar:
                             else:
                                 st.session_state.mag_data = {
                                     'mag': mag,
-                                    'features': features,
+                                    'geometrias': geometrias,
                                     'df': df,
                                     'crs': crs_info
                                 }
                                 # Activar capa de magnetometría automáticamente
                                 st.session_state.active_layers['magnetometry'] = True
-                                st.success(f"✅ {len(features)} features loaded from upload | Campo: {mag.campo_total.min():.1f} - {mag.campo_total.max():.1f} nT")
+                                st.success(f"✅ {len(geometrias)} features loaded from upload | Campo: {mag.estadisticas.get('min', np.nan):.1f} - {mag.estadisticas.get('max', np.nan):.1f} nT")
                                 st.rerun()
                                 
                         except Exception as e:
                             st.error(f"❌ Error loading shapefile: {e}")
-                            import traceback
                             st.code(traceback.format_exc()[:500])
             else:
                 st.warning("⚠️ Please upload all required files (.shp, .shx, .dbf)")
@@ -877,7 +1344,7 @@ with col_map:
         # Calcular centro una sola vez
         try:
             pr = st.session_state.landsat_data
-            _, _, center = crear_rgb_para_mapa(pr, 'B4', 'B3', 'B2')
+            _, center = obtener_bounds_mapa(pr)
             if center:
                 map_center = center
                 map_zoom = 10
@@ -885,28 +1352,8 @@ with col_map:
         except:
             pass
     
-    # Crear mapa base
-    m = folium.Map(
-        location=map_center,
-        zoom_start=map_zoom,
-        tiles=None  # No default tile
-    )
-    
-    # Agregar basemap según selección
-    if basemap == "OpenStreetMap":
-        folium.TileLayer('OpenStreetMap', name='OpenStreetMap').add_to(m)
-    elif basemap == "Satellite":
-        folium.TileLayer(
-            tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
-            attr='ESRI World Imagery',
-            name='Satellite'
-        ).add_to(m)
-    elif basemap == "Topographic":
-        folium.TileLayer(
-            tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Topo_Map/MapServer/tile/{z}/{y}/{x}',
-            attr='ESRI Topographic',
-            name='Topographic'
-        ).add_to(m)
+    # Mapa base cacheado (tiles + controles); cada rerun trabaja sobre una copia
+    m = copy.deepcopy(_crear_mapa_base(tuple(map_center), map_zoom, basemap))
     
     # ========================================================================
     # AGREGAR CAPAS ACTIVAS
@@ -919,39 +1366,30 @@ with col_map:
         # RGB Natural Color
         if st.session_state.active_layers.get('rgb_natural', False):
             try:
-                rgb_img, bounds, center = crear_rgb_para_mapa(pr, 'B4', 'B3', 'B2')
-                if rgb_img is not None and bounds is not None:
-                    img_base64 = array_to_png_base64(rgb_img)
-                    folium.raster_layers.ImageOverlay(
-                        image=img_base64, bounds=bounds, opacity=layer_opacity,
-                        name='RGB Natural', interactive=False, cross_origin=False
-                    ).add_to(m)
+                bounds, _ = obtener_bounds_mapa(pr)
+                imagen = crear_rgb_overlay(pr.bandas['B4'], pr.bandas['B3'], pr.bandas['B2'])
+                if bounds is not None:
+                    agregar_image_overlay(m, imagen, bounds, layer_opacity, 'RGB Natural')
             except Exception as e:
                 st.sidebar.error(f"❌ RGB Natural: {str(e)[:50]}")
         
         # False Color (NIR-R-G)
         if st.session_state.active_layers.get('rgb_false_color', False):
             try:
-                rgb_img, bounds, center = crear_rgb_para_mapa(pr, 'B5', 'B4', 'B3')
-                if rgb_img is not None and bounds is not None:
-                    img_base64 = array_to_png_base64(rgb_img)
-                    folium.raster_layers.ImageOverlay(
-                        image=img_base64, bounds=bounds, opacity=layer_opacity,
-                        name='False Color', interactive=False, cross_origin=False
-                    ).add_to(m)
+                bounds, _ = obtener_bounds_mapa(pr)
+                imagen = crear_rgb_overlay(pr.bandas['B5'], pr.bandas['B4'], pr.bandas['B3'])
+                if bounds is not None:
+                    agregar_image_overlay(m, imagen, bounds, layer_opacity, 'False Color')
             except Exception as e:
                 st.sidebar.error(f"❌ False Color: {str(e)[:50]}")
         
         # SWIR Composite (7-5-3)
         if st.session_state.active_layers.get('rgb_swir', False):
             try:
-                rgb_img, bounds, center = crear_rgb_para_mapa(pr, 'B7', 'B5', 'B3')
-                if rgb_img is not None and bounds is not None:
-                    img_base64 = array_to_png_base64(rgb_img)
-                    folium.raster_layers.ImageOverlay(
-                        image=img_base64, bounds=bounds, opacity=layer_opacity,
-                        name='SWIR Composite', interactive=False, cross_origin=False
-                    ).add_to(m)
+                bounds, _ = obtener_bounds_mapa(pr)
+                imagen = crear_rgb_overlay(pr.bandas['B7'], pr.bandas['B5'], pr.bandas['B3'])
+                if bounds is not None:
+                    agregar_image_overlay(m, imagen, bounds, layer_opacity, 'SWIR Composite')
             except Exception as e:
                 st.sidebar.error(f"❌ SWIR: {str(e)[:50]}")
         
@@ -959,28 +1397,30 @@ with col_map:
         for band in [b for b in pr.bandas.keys() if b.startswith('B') and len(b) <= 3]:
             if st.session_state.active_layers.get(f'band_{band}', False):
                 try:
-                    band_data = pr.bandas[band]
-                    _, bounds, _ = crear_rgb_para_mapa(pr, 'B4', 'B3', 'B2')
+                    bounds, _ = obtener_bounds_mapa(pr)
                     
-                    # Normalizar banda a 0-255
-                    valid = band_data[~np.isnan(band_data)]
-                    if len(valid) > 0:
-                        vmin, vmax = np.percentile(valid, [2, 98])
-                        band_norm = np.clip((band_data - vmin) / (vmax - vmin) * 255, 0, 255).astype(np.uint8)
+                    def generar_banda(band=band):
+                        band_data = _submuestrear_overlay(pr.bandas[band])
                         
-                        # Escala de grises
-                        gray_img = np.dstack([band_norm, band_norm, band_norm])
-                        img_base64 = array_to_png_base64(gray_img)
+                        # Normalizar banda a 0-255 (percentiles y estiramiento en float32)
+                        valid = band_data[np.isfinite(band_data)].astype(np.float32, copy=False)
+                        if len(valid) == 0:
+                            return None
+                        vmin, vmax = np.percentile(valid, [2, 98])
+                        band_norm = estirar_a_uint8(band_data, vmin, vmax,
+                                                    np.empty(band_data.shape, dtype=np.uint8))
                         
-                        folium.raster_layers.ImageOverlay(
-                            image=img_base64, bounds=bounds, opacity=layer_opacity,
-                            name=f'Band {band}', interactive=False, cross_origin=False
-                        ).add_to(m)
+                        # Escala de grises (un solo canal, modo 'L')
+                        return _codificar_imagen(band_norm)
+                    
+                    imagen = overlay_memorizado(f'band_{band}', pr.bandas[band], generar_banda)
+                    if imagen:
+                        agregar_image_overlay(m, imagen, bounds, layer_opacity, f'Band {band}')
                 except Exception as e:
                     st.sidebar.error(f"❌ Band {band}: {str(e)[:50]}")
     
     # ========== MINERAL INDICES ==========
-    for idx_name in ['gossan', 'oxidos', 'argilica', 'propilitica', 'carbonatos', 'clay', 'ndvi']:
+    for idx_name in CALCULOS_INDICES:
         if (st.session_state.active_layers.get(f'idx_{idx_name}', False) and 
             idx_name in st.session_state.indices):
             
@@ -989,31 +1429,20 @@ with col_map:
                 index_data = st.session_state.indices[idx_name]
                 
                 # Obtener bounds
-                _, bounds, center = crear_rgb_para_mapa(pr, 'B4', 'B3', 'B2')
+                bounds, center = obtener_bounds_mapa(pr)
                 
                 if bounds is not None:
                     # Seleccionar colormap según índice
-                    cmaps = {
-                        'gossan': 'RdYlBu_r',
-                        'oxidos': 'OrRd',
-                        'argilica': 'YlOrBr',
-                        'propilitica': 'YlGn',
-                        'carbonatos': 'Greys',
-                        'clay': 'PuRd',
-                        'ndvi': 'RdYlGn'
-                    }
-                    
-                    img_base64 = crear_index_para_mapa(index_data, bounds, cmaps.get(idx_name, 'viridis'))
+                    cmap = CMAPS_INDICES.get(idx_name, 'viridis')
+                    # El índice entra a la caché ya submuestreado (huella solo
+                    # de los píxeles que se dibujan)
+                    imagen = overlay_memorizado(
+                        f'idx_{idx_name}_{cmap}', index_data,
+                        lambda: crear_index_para_mapa(_submuestrear_overlay(index_data), bounds, cmap)
+                    )
                     
-                    if img_base64:
-                        folium.raster_layers.ImageOverlay(
-                            image=img_base64,
-                            bounds=bounds,
-                            opacity=layer_opacity,
-                            name=idx_name.title(),
-                            interactive=False,
-                            cross_origin=False
-                        ).add_to(m)
+                    if imagen:
+                        agregar_image_overlay(m, imagen, bounds, layer_opacity, idx_name.title())
             except Exception as e:
                 st.sidebar.error(f"❌ {idx_name}: {str(e)[:50]}")
     
@@ -1023,7 +1452,7 @@ with col_map:
         
         try:
             mag = st.session_state.mag_data['mag']
-            features = st.session_state.mag_data['features']
+            geometrias = st.session_state.mag_data['geometrias']
             crs_info = st.session_state.mag_data.get('crs')
             
             # Calcular estadísticas si no existen
@@ -1044,8 +1473,7 @@ with col_map:
             # Folium puede manejar diferentes CRS automáticamente
             coords_transformed = False
             
-            # Transformar features manualmente (sin pyproj/shapely problemáticos)
-            features_wgs84 = []
+            # Transformar geometrías con la conversión UTM aproximada
             need_transform = False
             utm_zone = None
             
@@ -1053,125 +1481,104 @@ with col_map:
             crs_code = str(crs_info).upper() if crs_info else ''
             st.sidebar.info(f"📍 Source CRS detected")
             
-            # Detectar zona UTM desde string PROJCS o EPSG
-            if 'UTM_ZONE_13' in crs_code or 'EPSG:32613' in crs_code:
-                need_transform = True
-                utm_zone = 13
-            elif 'UTM_ZONE_12' in crs_code or 'EPSG:32612' in crs_code:
-                need_transform = True
-                utm_zone = 12
-            elif 'UTM_ZONE_14' in crs_code or 'EPSG:32614' in crs_code:
-                need_transform = True
-                utm_zone = 14
-            elif 'EPSG:4326' in crs_code or 'WGS 84' in crs_code and 'UTM' not in crs_code:
-                need_transform = False
+            # Detectar zona UTM desde string PROJCS o EPSG (una sola búsqueda)
+            utm_zone = _detectar_zona_utm(crs_code)
+            need_transform = utm_zone is not None
             
-            # Transformar geometrías manualmente
-            if need_transform and utm_zone:
-                st.sidebar.info(f"🔄 Transform UTM {utm_zone}N → WGS84")
+            def generar_capa_mag():
+                """Transforma las geometrías dibujadas y arma el FeatureGroup"""
+                import shapely
+                from shapely.geometry import mapping
+                
+                # Solo las geometrías que se dibujan pasan a dicts GeoJSON
+                max_features = min(len(geometrias), len(mag.campo_total), 3000)
+                dibujadas = geometrias[:max_features]
                 
-                def utm_to_latlon_simple(x, y, zone=13):
-                    """Conversión aproximada UTM a Lat/Lon para Hemisferio Norte"""
+                # Transformar coordenadas de todas las geometrías en una sola llamada
+                if need_transform and utm_zone:
                     # Centro de la zona UTM
-                    lon_center = (zone - 1) * 6 - 180 + 3
+                    lon_center = (utm_zone - 1) * 6 - 180 + 3
                     
-                    # Conversión simplificada (aproximada)
-                    # Para hemisferio NORTE: y es directamente metros desde ecuador
-                    lat = y / 111320.0  # NO restar 10000000 (eso es para hemisferio sur)
-                    lon = lon_center + (x - 500000) / (111320.0 * np.cos(np.radians(lat)))
+                    def utm_to_latlon_simple(xy):
+                        """Conversión aproximada UTM a Lat/Lon para Hemisferio Norte"""
+                        # Conversión simplificada (aproximada)
+                        # Para hemisferio NORTE: y es directamente metros desde ecuador
+                        lat = xy[:, 1] / 111320.0  # NO restar 10000000 (eso es para hemisferio sur)
+                        lon = lon_center + (xy[:, 0] - 500000) / (111320.0 * np.cos(np.radians(lat)))
+                        return np.column_stack([lon, lat])
                     
-                    return lon, lat
+                    dibujadas = shapely.transform(dibujadas, utm_to_latlon_simple)
                 
-                for feature in features:
-                    try:
-                        geom = feature['geometry']
-                        geom_type = geom['type']
-                        
-                        if geom_type == 'Polygon':
-                            # Transformar cada coordenada del polígono
-                            new_coords = []
-                            for ring in geom['coordinates']:
-                                new_ring = []
-                                for coord in ring:
-                                    lon, lat = utm_to_latlon_simple(coord[0], coord[1], utm_zone)
-                                    new_ring.append([lon, lat])
-                                new_coords.append(new_ring)
-                            
-                            feature_wgs84 = {
-                                'type': 'Feature',
-                                'geometry': {
-                                    'type': 'Polygon',
-                                    'coordinates': new_coords
-                                },
-                                'properties': dict(feature['properties'])  # Convertir a dict
-                            }
-                            features_wgs84.append(feature_wgs84)
-                        
-                        elif geom_type == 'Point':
-                            lon, lat = utm_to_latlon_simple(geom['coordinates'][0], geom['coordinates'][1], utm_zone)
-                            feature_wgs84 = {
-                                'type': 'Feature',
-                                'geometry': {
-                                    'type': 'Point',
-                                    'coordinates': [lon, lat]
-                                },
-                                'properties': dict(feature['properties'])  # Convertir a dict
-                            }
-                            features_wgs84.append(feature_wgs84)
-                        else:
-                            features_wgs84.append(feature)
-                    except Exception as e:
-                        features_wgs84.append(feature)
+                features_wgs84 = [{'type': 'Feature', 'geometry': mapping(geom)} for geom in dibujadas]
                 
-                st.sidebar.success(f"✅ Transformed {len(features_wgs84)} features")
-            else:
-                features_wgs84 = features
-                st.sidebar.info("📍 Using original coordinates")
-            
-            # Crear FeatureGroup con pane de z-index alto
-            mag_group = folium.FeatureGroup(name='Magnetometry', show=True, overlay=True)
-            
-            features_added = 0
-            max_features = min(len(features_wgs84), len(mag.campo_total), 3000)
-            
-            # Agregar features transformados
-            for i in range(max_features):
-                valor = mag.campo_total[i]
-                if np.isnan(valor) or np.isinf(valor):
-                    continue
+                # Crear FeatureGroup con pane de z-index alto
+                mag_group = folium.FeatureGroup(name='Magnetometry', show=True, overlay=True)
                 
-                # Color
-                norm_val = (valor - campo_min) / (campo_max - campo_min) if campo_max != campo_min else 0.5
-                norm_val = np.clip(norm_val, 0, 1)
+                primer_error = None
                 
-                color = cm.get_cmap('jet')(norm_val)
-                color_hex = '#{:02x}{:02x}{:02x}'.format(
-                    int(color[0]*255), int(color[1]*255), int(color[2]*255)
-                )
+                # Colores y anomalías de todos los valores en una pasada de NumPy
+                valores = mag.campo_total[:max_features]
+                validos = np.isfinite(valores)
+                if campo_max != campo_min:
+                    norm = np.clip((valores - campo_min) / (campo_max - campo_min), 0, 1)
+                else:
+                    norm = np.full(valores.shape, 0.5)
+                indices_color = np.minimum(np.where(validos, norm, 0) * 256, 255).astype(np.intp)
+                colores_hex = _lut_hex('jet')[indices_color]
                 
                 # Anomalía
-                desviacion = (valor - campo_mean) / campo_std if campo_std > 0 else 0
-                anomalia = "🔴" if desviacion > 1 else ("🔵" if desviacion < -1 else "⚪")
+                desviacion = (valores - campo_mean) / campo_std if campo_std > 0 else np.zeros(valores.shape)
+                anomalias = np.where(desviacion > 1, "🔴", np.where(desviacion < -1, "🔵", "⚪"))
                 
+                # Una sola FeatureCollection con color y tooltip por feature en
+                # sus propiedades: una capa GeoJson en lugar de miles
+                coleccion = [
+                    {
+                        'type': 'Feature',
+                        'geometry': features_wgs84[i]['geometry'],
+                        'properties': {'color': str(colores_hex[i]),
+                                       'tooltip': f"{anomalias[i]} {valores[i]:.1f} nT"}
+                    }
+                    for i in np.flatnonzero(validos)
+                ]
+                
+                # La opacidad se lee al renderizar: se actualiza en este dict
+                # en cada rerun sin reconstruir la capa
+                estilo = {'fillOpacity': layer_opacity * 0.7}
+                
+                features_added = 0
                 try:
                     folium.GeoJson(
-                        features_wgs84[i],
-                        style_function=lambda x, c=color_hex: {
-                            'fillColor': c,
+                        {'type': 'FeatureCollection', 'features': coleccion},
+                        style_function=lambda x: {
+                            'fillColor': x['properties']['color'],
                             'color': 'black',
                             'weight': 0.8,
-                            'fillOpacity': layer_opacity * 0.7,
+                            'fillOpacity': estilo['fillOpacity'],
                             'zIndex': 1000  # z-index alto para que se vea encima
                         },
-                        tooltip=f"{anomalia} {valor:.1f} nT"
+                        tooltip=folium.GeoJsonTooltip(fields=['tooltip'], labels=False)
                     ).add_to(mag_group)
-                    
-                    features_added += 1
-                    
+                    features_added = len(coleccion)
                 except Exception as geom_error:
-                    if features_added == 0:  # Solo mostrar el primer error
-                        st.sidebar.warning(f"⚠️ Geom error: {str(geom_error)[:80]}")
-                    continue
+                    primer_error = str(geom_error)[:80]
+                
+                return mag_group, estilo, features_wgs84, features_added, max_features, primer_error
+            
+            # El FeatureGroup solo se reconstruye si cambian los datos o la zona;
+            # la opacidad se aplica sobre la capa memorizada
+            mag_group, estilo, features_wgs84, features_added, max_features, primer_error = overlay_memorizado(
+                f'magnetometria_{utm_zone}', st.session_state.mag_data, generar_capa_mag
+            )
+            estilo['fillOpacity'] = layer_opacity * 0.7
+            
+            if need_transform and utm_zone:
+                st.sidebar.info(f"🔄 Transform UTM {utm_zone}N → WGS84")
+                st.sidebar.success(f"✅ Transformed {len(features_wgs84)} features")
+            else:
+                st.sidebar.info("📍 Using original coordinates")
+            if primer_error:
+                st.sidebar.warning(f"⚠️ Geom error: {primer_error}")
             
             mag_group.add_to(m)
             
@@ -1194,43 +1601,9 @@ with col_map:
             
         except Exception as e:
             st.sidebar.error(f"❌ Mag error: {str(e)[:200]}")
-            import traceback
             tb = traceback.format_exc()
             st.sidebar.code(tb[-600:])
     
-    # Controles del mapa
-    folium.plugins.MeasureControl(position='topleft').add_to(m)
-    folium.plugins.Fullscreen(position='topleft').add_to(m)
-    folium.plugins.MousePosition().add_to(m)
-    
-    # Herramienta de dibujo para definir área de interés
-    draw = folium.plugins.Draw(
-        export=True,
-        position='topleft',
-        draw_options={
-            'polyline': False,
-            'circle': False,
-            'circlemarker': False,
-            'marker': False,
-            'polygon': {
-                'allowIntersection': False,
-                'shapeOptions': {
-                    'color': '#00ff00',
-                    'weight': 3,
-                    'fillOpacity': 0.2
-                }
-            },
-            'rectangle': {
-                'shapeOptions': {
-                    'color': '#00ff00',
-                    'weight': 3,
-                    'fillOpacity': 0.2
-                }
-            }
-        }
-    )
-    draw.add_to(m)
-    
     # Mostrar mapa y capturar geometrías dibujadas
     map_data = st_folium(
         m,
@@ -1335,7 +1708,6 @@ with col_inspector:
                     
                     except Exception as e:
                         st.error(f"❌ Search error: {str(e)}")
-                        import traceback
                         st.code(traceback.format_exc())
                         st.session_state.search_results = None
         
@@ -1393,19 +1765,21 @@ with col_inspector:
                                         if downloaded and len(downloaded) > 0:
                                             # Verificar que no sean archivos HTML de error
                                             scene_path = downloader.output_dir / selected_scene['id']
-                                            first_file = list(scene_path.glob("*.TIF"))[0] if scene_path.exists() else None
+                                            scene_existe = scene_path.exists()
+                                            first_file = list(scene_path.glob("*.TIF"))[0] if scene_existe else None
                                             
                                             if first_file and first_file.stat().st_size < 100000:  # < 100KB es sospechoso
                                                 st.error("❌ Download failed - files are too small (likely HTML error pages)")
                                                 st.warning("⚠️ USGS requires authentication. Please use manual download from EarthExplorer.")
                                             else:
                                                 st.success(f"✅ Downloaded {len(downloaded)} files")
+                                                # Invalidar el escaneo de escenas locales
+                                                buscar_escenas_locales.clear()
                                                 st.info(f"📂 Location: {scene_path}")
                                                 
                                                 # Auto-cargar la escena descargada
-                                                if scene_path.exists():
-                                                    pr = TerrafPR(str(scene_path))
-                                                    pr.cargar_bandas(reducir=True, factor=4)
+                                                if scene_existe:
+                                                    pr = cargar_escena_landsat(str(scene_path), reducir=True, factor=4)
                                                     st.session_state.landsat_data = pr
                                                     st.session_state.landsat_scene_name = selected_scene['id']
                                                     # Activar capa RGB Natural automáticamente
@@ -1419,7 +1793,6 @@ with col_inspector:
                                         
                                 except Exception as e:
                                     st.error(f"❌ Download error: {str(e)}")
-                                    import traceback
                                     st.code(traceback.format_exc())
     
     st.markdown("---")
@@ -1435,18 +1808,13 @@ with col_inspector:
         st.markdown("**Indices Calculated:**")
         for idx_name, idx_data in st.session_state.indices.items():
             with st.expander(f"📈 {idx_name.title()}", expanded=False):
-                st.text(f"Min: {np.nanmin(idx_data):.4f}")
-                st.text(f"Max: {np.nanmax(idx_data):.4f}")
-                st.text(f"Mean: {np.nanmean(idx_data):.4f}")
+                resumen = resumen_array(idx_data, bins=30)
+                st.text(f"Min: {resumen['min']:.4f}")
+                st.text(f"Max: {resumen['max']:.4f}")
+                st.text(f"Mean: {resumen['mean']:.4f}")
                 
-                # Mini histogram
-                fig_mini, ax_mini = plt.subplots(figsize=(3, 2))
-                data_flat = idx_data[~np.isnan(idx_data)].flatten()
-                ax_mini.hist(data_flat, bins=30, color='steelblue', alpha=0.7)
-                ax_mini.set_ylabel('Freq', fontsize=8)
-                ax_mini.tick_params(labelsize=7)
-                st.pyplot(fig_mini)
-                plt.close()
+                # Mini histogram (Vega-Lite en el navegador)
+                st.bar_chart(resumen['hist'], height=150, color='#4682b4')
     
     if st.session_state.mag_data:
         st.markdown("**🧲 Magnetometry:**")
@@ -1454,45 +1822,32 @@ with col_inspector:
         
         # Campo total
         with st.expander("📡 Total Field", expanded=True):
+            resumen = resumen_array(mag.campo_total, bins=30)
             st.metric("Points", f"{len(mag.campo_total):,}")
-            st.metric("Range (nT)", f"{np.nanmin(mag.campo_total):.1f} - {np.nanmax(mag.campo_total):.1f}")
-            st.metric("Mean (nT)", f"{np.nanmean(mag.campo_total):.1f}")
-            st.metric("Std Dev (nT)", f"{np.nanstd(mag.campo_total):.1f}")
+            st.metric("Range (nT)", f"{resumen['min']:.1f} - {resumen['max']:.1f}")
+            st.metric("Mean (nT)", f"{resumen['mean']:.1f}")
+            st.metric("Std Dev (nT)", f"{resumen['std']:.1f}")
             
-            # Mini histogram
-            fig_mag, ax_mag = plt.subplots(figsize=(3, 2))
-            ax_mag.hist(mag.campo_total[~np.isnan(mag.campo_total)], bins=30, 
-                       color='darkblue', alpha=0.7, edgecolor='black')
-            ax_mag.set_ylabel('Freq', fontsize=8)
-            ax_mag.set_xlabel('nT', fontsize=8)
-            ax_mag.tick_params(labelsize=7)
-            ax_mag.grid(True, alpha=0.3)
-            st.pyplot(fig_mag)
-            plt.close()
+            # Mini histogram (Vega-Lite en el navegador)
+            st.bar_chart(resumen['hist'], height=150, color='#00008b')
         
         # Derivadas calculadas
         if mag.derivadas:
             with st.expander(f"📈 Derivatives ({len(mag.derivadas)})", expanded=False):
                 for deriv_name, deriv_data in mag.derivadas.items():
+                    resumen = resumen_array(deriv_data, bins=30)
                     st.text(f"• {deriv_name.replace('_', ' ').title()}")
-                    st.text(f"  Range: {np.nanmin(deriv_data):.2e} - {np.nanmax(deriv_data):.2e}")
+                    st.text(f"  Range: {resumen['min']:.2e} - {resumen['max']:.2e}")
         
         # Anomalía residual
         if mag.anomalia is not None:
             with st.expander("🎯 Residual Anomaly", expanded=False):
-                st.metric("Range (nT)", f"{np.nanmin(mag.anomalia):.1f} - {np.nanmax(mag.anomalia):.1f}")
-                st.metric("Mean (nT)", f"{np.nanmean(mag.anomalia):.1f}")
+                resumen = resumen_array(mag.anomalia, bins=30)
+                st.metric("Range (nT)", f"{resumen['min']:.1f} - {resumen['max']:.1f}")
+                st.metric("Mean (nT)", f"{resumen['mean']:.1f}")
                 
-                # Mini histogram
-                fig_anom, ax_anom = plt.subplots(figsize=(3, 2))
-                ax_anom.hist(mag.anomalia[~np.isnan(mag.anomalia)], bins=30, 
-                           color='darkred', alpha=0.7, edgecolor='black')
-                ax_anom.set_ylabel('Freq', fontsize=8)
-                ax_anom.set_xlabel('nT', fontsize=8)
-                ax_anom.tick_params(labelsize=7)
-                ax_anom.grid(True, alpha=0.3)
-                st.pyplot(fig_anom)
-                plt.close()
+                # Mini histogram (Vega-Lite en el navegador)
+                st.bar_chart(resumen['hist'], height=150, color='#8b0000')
 
 # ============================================================================
 # PANEL INFERIOR - VISUALIZACIONES RÁPIDAS
@@ -1511,21 +1866,22 @@ if st.session_state.indices or st.session_state.mag_data:
             cols = st.columns(min(3, len(st.session_state.indices)))
             for i, (name, data) in enumerate(list(st.session_state.indices.items())[:3]):
                 with cols[i]:
-                    fig, ax = plt.subplots(figsize=(4, 3))
-                    data_flat = data[~np.isnan(data)].flatten()
-                    ax.hist(data_flat, bins=50, color='steelblue', alpha=0.7, edgecolor='black')
-                    ax.set_title(name.title(), fontsize=10, fontweight='bold')
-                    ax.set_xlabel('Value', fontsize=9)
-                    ax.set_ylabel('Frequency', fontsize=9)
-                    ax.tick_params(labelsize=8)
-                    ax.grid(True, alpha=0.3)
-                    st.pyplot(fig)
-                    plt.close()
+                    resumen = resumen_array(data, bins=50, columna='Frequency')
+                    st.markdown(f"**{name.title()}**")
+                    st.bar_chart(resumen['hist'], height=250, color='#4682b4')
     
     with tabs[2]:
         if st.session_state.indices:
-            # Mostrar miniaturas de colormaps
-            st.info("Index colormaps preview coming soon")
+            # Miniaturas RGBA (LUT del colormap), sin figuras de Matplotlib
+            cols = st.columns(min(3, len(st.session_state.indices)))
+            for i, (name, data) in enumerate(st.session_state.indices.items()):
+                cmap = CMAPS_INDICES.get(name, 'viridis')
+                miniatura = vista_previa_indice(_submuestrear_overlay(data, 400), cmap)
+                with cols[i % len(cols)]:
+                    if miniatura is None:
+                        st.caption(f"{name.title()}: no valid data")
+                    else:
+                        st.image(miniatura, caption=f"{name.title()} ({cmap})")
 
 # Footer
 st.markdown("---")
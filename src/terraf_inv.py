@@ -5,9 +5,123 @@ Módulo para inversión de datos geofísicos (magnetometría, gravimetría, etc.
 
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy.optimize import minimize, least_squares
-from scipy.spatial.distance import cdist
+from scipy.linalg import cho_factor, cho_solve, lstsq
+from scipy.sparse import coo_matrix
+from scipy.sparse.linalg import lsmr, LinearOperator
+from scipy.sparse.csgraph import connected_components
+from scipy.interpolate import griddata, LinearNDInterpolator
+from scipy.spatial import cKDTree, Delaunay
 import warnings
+import math
+import functools
+
+try:
+    from numba import vectorize
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def _anomalia_dipolo_np(x_obs, y_obs, z_obs, x_src, y_src, z_src, coef):
+    """
+    Anomalía de una fuente puntual: coef * (3cos²θ - 1) / r³ (r mínimo 1 m)
+    
+    Acepta arrays con broadcasting (observaciones contra fuentes).
+    """
+    # Las operaciones in situ necesitan buffers float (coordenadas enteras)
+    x_obs, y_obs, z_obs, x_src, y_src, z_src = (
+        np.asarray(v, dtype=np.float64) for v in (x_obs, y_obs, z_obs, x_src, y_src, z_src)
+    )
+    dx = x_obs - x_src
+    dy = y_obs - y_src
+    dz = z_obs - z_src
+    
+    # r² acumulado in situ sobre un solo buffer
+    r = np.asarray(dx * dx + dy * dy)
+    r += dz * dz
+    np.sqrt(r, out=r)
+    
+    # Evitar división por cero
+    np.maximum(r, 1.0, out=r)
+    
+    # coef * (3cos²θ - 1) / r³ evaluado in situ sobre un solo buffer
+    anomaly = dz / r
+    anomaly *= anomaly
+    anomaly *= 3
+    anomaly -= 1
+    r *= r * r
+    anomaly /= r
+    anomaly *= coef
+    return anomaly
+
+
+def _anomalia_dipolo_py(x_obs, y_obs, z_obs, x_src, y_src, z_src, coef):
+    # Versión escalar del kernel, compilada con numba.vectorize
+    dx = x_obs - x_src
+    dy = y_obs - y_src
+    dz = z_obs - z_src
+    r = max(math.sqrt(dx * dx + dy * dy + dz * dz), 1.0)
+    cos_theta = dz / r
+    return coef * (3.0 * cos_theta * cos_theta - 1.0) / (r * r * r)
+
+
+if NUMBA_AVAILABLE:
+    # Versión compilada: un solo ciclo fusionado sin arrays temporales.
+    # Es un ufunc, así que conserva el broadcasting y acepta out=.
+    # vectorize con firma compila al crearse (y target='parallel' no admite
+    # cache=True): los kernels se crean en el primer uso, no al importar
+    _FIRMA_DIPOLO = ['float64(float64, float64, float64, float64, float64, float64, float64)']
+    
+    @functools.lru_cache(maxsize=None)
+    def _anomalia_dipolo():
+        return vectorize(_FIRMA_DIPOLO, fastmath=True, cache=True)(_anomalia_dipolo_py)
+    
+    @functools.lru_cache(maxsize=None)
+    def _anomalia_dipolo_par():
+        # Variante multihilo para arrays grandes (matriz de sensibilidad)
+        return vectorize(_FIRMA_DIPOLO, target='parallel', fastmath=True)(_anomalia_dipolo_py)
+else:
+    def _anomalia_dipolo():
+        return _anomalia_dipolo_np
+
+
+def _coeficiente_esfera(radius, susceptibility):
+    """
+    Factor μ₀/4π · m (en nT) de una esfera de radio y susceptibilidad dados
+    """
+    # Volumen de la esfera
+    V = (4/3) * np.pi * radius**3
+    
+    # Momento magnético
+    m = V * susceptibility
+    
+    # Constante magnética μ₀ = 4π × 10^-7 T·m/A
+    # Conversión a nT: × 10^9
+    mu_0 = 4 * np.pi * 1e-7
+    factor = (mu_0 * 1e9) / (4 * np.pi)
+    
+    return factor * m
+
+
+# Columnas de las soluciones de Euler
+_DTYPE_EULER = np.dtype([
+    ('x0', 'f8'), ('y0', 'f8'), ('z0', 'f8'),
+    ('base_level', 'f8'), ('residual', 'f8'), ('n_points', 'i8')
+])
+
+
+def _normalizar_01(arr):
+    """
+    Normaliza a [0, 1] ignorando NaN (mínimo y máximo se calculan una sola vez)
+    """
+    vmin, vmax = np.nanmin(arr), np.nanmax(arr)
+    # Un solo temporal: la resta crea el resultado y la división es in-place
+    norm = np.subtract(arr, vmin, dtype=np.result_type(arr, 1.0))
+    norm /= (vmax - vmin)
+    return norm
+
 
 class TerrafInv:
     """
@@ -54,56 +168,66 @@ class TerrafInv:
         print(f"   Índice estructural: {structural_index}")
         print(f"   Ventana: {ventana} puntos")
         
-        soluciones = []
+        N = structural_index
         
-        # Crear grilla de ventanas
+        # Crear grilla de ventanas: todas tienen `ventana` puntos porque el
+        # último inicio es < n - ventana
         n = len(x)
-        for i in range(0, n - ventana, ventana // 2):
-            # Ventana de datos
-            idx = slice(i, min(i + ventana, n))
-            
-            x_w = x[idx]
-            y_w = y[idx]
-            T_w = mag[idx]
-            dTdx_w = dx_mag[idx]
-            dTdy_w = dy_mag[idx]
-            dTdz_w = dz_mag[idx]
-            
-            # Saltar si hay NaN
-            if np.any(np.isnan([x_w, y_w, T_w, dTdx_w, dTdy_w, dTdz_w])):
-                continue
-            
-            # Matriz de diseño: [dT/dx, dT/dy, dT/dz, -N]
-            N = structural_index
-            A = np.column_stack([dTdx_w, dTdy_w, dTdz_w, np.full(len(x_w), -N)])
-            
-            # Vector de datos: [x*dT/dx + y*dT/dy + z*dT/dz]
-            # Asumir z=0 para observaciones en superficie
-            b = x_w * dTdx_w + y_w * dTdy_w + 0 * dTdz_w
-            
-            # Resolver sistema (mínimos cuadrados)
-            try:
-                sol = np.linalg.lstsq(A, b, rcond=None)[0]
-                
-                x0, y0, z0, base = sol
-                
-                # Filtrar soluciones no físicas
-                if z0 > 0 and z0 < 5000:  # Profundidad entre 0 y 5 km
-                    # Calcular error
-                    residual = np.linalg.norm(A @ sol - b)
-                    
-                    soluciones.append({
-                        'x0': x0,
-                        'y0': y0,
-                        'z0': z0,
-                        'base_level': base,
-                        'residual': residual,
-                        'n_points': len(x_w)
-                    })
-            except:
-                continue
-        
-        df_euler = pd.DataFrame(soluciones)
+        inicios = np.arange(0, n - ventana, max(ventana // 2, 1))
+        
+        if len(inicios) == 0:
+            print(f"   ⚠️  No se encontraron soluciones válidas")
+            return pd.DataFrame(np.empty(0, dtype=_DTYPE_EULER))
+        
+        # Saltar ventanas con NaN: una ventana contiene NaN si el conteo
+        # acumulado de NaN cambia entre su inicio y su fin (O(n), una pasada)
+        hay_nan = (np.isnan(x) | np.isnan(y) | np.isnan(mag) |
+                   np.isnan(dx_mag) | np.isnan(dy_mag) | np.isnan(dz_mag))
+        conteo = np.concatenate(([0], np.cumsum(hay_nan)))
+        inicios = inicios[conteo[inicios + ventana] == conteo[inicios]]
+        
+        # Ventanas de datos apiladas: (n_ventanas, ventana)
+        def ventanas(arr):
+            return sliding_window_view(np.asarray(arr, dtype=float), ventana)[inicios]
+        
+        x_w = ventanas(x)
+        y_w = ventanas(y)
+        dTdx_w = ventanas(dx_mag)
+        dTdy_w = ventanas(dy_mag)
+        dTdz_w = ventanas(dz_mag)
+        
+        # Matriz de diseño por ventana: [dT/dx, dT/dy, dT/dz, -N] -> (n_ventanas, ventana, 4)
+        A = np.stack([dTdx_w, dTdy_w, dTdz_w, np.full_like(dTdx_w, -N)], axis=-1)
+        
+        # Vector de datos: [x*dT/dx + y*dT/dy + z*dT/dz]
+        # Asumir z=0 para observaciones en superficie
+        b = x_w * dTdx_w + y_w * dTdy_w
+        
+        # Resolver todas las ventanas a la vez (ecuaciones normales 4x4 apiladas)
+        AtA = np.einsum('wij,wik->wjk', A, A)
+        Atb = np.einsum('wij,wi->wj', A, b)
+        try:
+            sols = np.linalg.solve(AtA, Atb[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            # Alguna ventana es singular: mínimos cuadrados ventana por ventana
+            # (gelsy, QR con pivoteo: más rápido que gelsd para 4 columnas).
+            # Sin overwrite_a/b porque A y b se usan después para el residual
+            sols = np.array([lstsq(A_i, b_i, lapack_driver='gelsy', check_finite=False)[0]
+                             for A_i, b_i in zip(A, b)]).reshape(-1, 4)
+        
+        # Soluciones en un arreglo estructurado preasignado (una fila por ventana)
+        soluciones = np.empty(len(sols), dtype=_DTYPE_EULER)
+        soluciones['x0'], soluciones['y0'], soluciones['z0'], soluciones['base_level'] = sols.T
+        soluciones['n_points'] = ventana
+        
+        # Calcular error
+        soluciones['residual'] = np.linalg.norm(np.einsum('wij,wj->wi', A, sols) - b, axis=1)
+        
+        # Filtrar soluciones no físicas
+        z0 = soluciones['z0']
+        fisicas = (z0 > 0) & (z0 < 5000)  # Profundidad entre 0 y 5 km
+        
+        df_euler = pd.DataFrame(soluciones[fisicas])
         
         if len(df_euler) > 0:
             print(f"   ✅ {len(df_euler)} soluciones encontradas")
@@ -143,31 +267,10 @@ class TerrafInv:
         My = susceptibility * np.cos(inc_rad) * np.sin(dec_rad)
         Mz = susceptibility * np.sin(inc_rad)
         
-        # Distancias
-        dx = x_obs - x_src
-        dy = y_obs - y_src
-        dz = z_obs - z_src
-        r = np.sqrt(dx**2 + dy**2 + dz**2)
-        
-        # Evitar división por cero
-        r = np.maximum(r, 1.0)
-        
-        # Volumen de la esfera
-        V = (4/3) * np.pi * radius**3
-        
-        # Momento magnético
-        m = V * susceptibility
-        
         # Componente vertical de la anomalía (simplificado)
-        # T ≈ (2πμ₀/4π) * m * (3cos²(θ) - 1) / r³
-        cos_theta = dz / r
-        
-        # Constante magnética μ₀ = 4π × 10^-7 T·m/A
-        # Conversión a nT: × 10^9
-        mu_0 = 4 * np.pi * 1e-7
-        factor = (mu_0 * 1e9) / (4 * np.pi)
-        
-        anomaly = factor * m * (3 * cos_theta**2 - 1) / r**3
+        # T ≈ (2πμ₀/4π) * m * (3cos²(θ) - 1) / r³,  cos(θ) = dz / r
+        coef = _coeficiente_esfera(radius, susceptibility)
+        anomaly = _anomalia_dipolo()(x_obs, y_obs, z_obs, x_src, y_src, z_src, coef)
         
         return anomaly
     
@@ -196,23 +299,26 @@ class TerrafInv:
         y_grid = np.linspace(y1, y2, ny)
         z_grid = np.linspace(z1, z2, nz)
         
-        anomaly_total = np.zeros_like(x_obs)
-        
         # Volumen de cada subcubo
         dV = ((x2-x1)/nx) * ((y2-y1)/ny) * ((z2-z1)/nz)
         
-        for xi in x_grid:
-            for yi in y_grid:
-                for zi in z_grid:
-                    # Simular como esfera equivalente
-                    r_equiv = (3 * dV / (4 * np.pi))**(1/3)
-                    anomaly = self.forward_magnetic_sphere(
-                        x_obs, y_obs, z_obs, xi, yi, zi,
-                        r_equiv, susceptibility, inclination, declination
-                    )
-                    anomaly_total += anomaly
-        
-        return anomaly_total
+        # Simular cada subcubo como esfera equivalente
+        r_equiv = (3 * dV / (4 * np.pi))**(1/3)
+        
+        # Centros de los subcubos aplanados: (nx*ny*nz,)
+        xs, ys, zs = np.meshgrid(x_grid, y_grid, z_grid, indexing='ij')
+        
+        # Evaluar todas las fuentes a la vez: observaciones (..., 1) contra
+        # fuentes (nx*ny*nz,) y sumar la contribución de cada subcubo
+        x_obs = np.asarray(x_obs)[..., None]
+        y_obs = np.asarray(y_obs)[..., None]
+        z_obs = np.asarray(z_obs)[..., None]
+        anomaly = self.forward_magnetic_sphere(
+            x_obs, y_obs, z_obs, xs.ravel(), ys.ravel(), zs.ravel(),
+            r_equiv, susceptibility, inclination, declination
+        )
+        
+        return anomaly.sum(axis=-1)
     
     # ========================================================================
     # INVERSIÓN DE SUSCEPTIBILIDAD MAGNÉTICA 3D
@@ -220,7 +326,9 @@ class TerrafInv:
     
     def inversion_susceptibility_3d(self, x_obs, y_obs, mag_obs, 
                                     mesh_params, inclination=45, declination=0,
-                                    alpha=1.0, max_iter=50):
+                                    alpha=1.0, max_iter=None, solver='cholesky',
+                                    dtype=np.float32, return_G=False, memmap_path=None,
+                                    tol=None):
         """
         Inversión 3D de susceptibilidad magnética usando mínimos cuadrados regularizados
         
@@ -231,7 +339,19 @@ class TerrafInv:
                 {'nx', 'ny', 'nz', 'dx', 'dy', 'dz', 'z_top'}
             inclination, declination (float): Ángulos del campo (grados)
             alpha (float): Parámetro de regularización
-            max_iter (int): Iteraciones máximas
+            max_iter (int): Iteraciones máximas (solver 'lsmr'); None usa
+                10·min(n_obs, n_celdas)
+            solver (str): 'cholesky' (ecuaciones normales, directo) o
+                'lsmr' (iterativo, no forma G^T G; recomendado para mallas grandes)
+            dtype: Precisión de la matriz de sensibilidad G (float32 reduce a
+                la mitad la memoria; el sistema se resuelve en float64)
+            return_G (bool): Incluir la matriz de sensibilidad en el resultado
+                ('G_matrix'); por defecto se libera al terminar
+            memmap_path (str): Si se indica, G se construye en un archivo .npy
+                mapeado en memoria (np.lib.format.open_memmap) en lugar de RAM
+            tol (float): Tolerancia atol/btol de lsmr; None la deriva de la
+                precisión de G: 10·eps (redondeo de los productos con G), sin
+                bajar de √eps de float64
         
         Returns:
             dict: Modelo 3D de susceptibilidad
@@ -264,48 +384,99 @@ class TerrafInv:
         
         # Matriz de sensibilidad (kernel)
         # Cada fila: respuesta de una celda en todas las observaciones
-        G = np.zeros((n_obs, n_cells))
+        # Las coordenadas se mantienen en float64 (UTM) y el kernel se evalúa
+        # en float64; solo se almacena en la precisión pedida
+        if memmap_path is not None:
+            G = np.lib.format.open_memmap(memmap_path, mode='w+', dtype=dtype,
+                                          shape=(n_obs, n_cells))
+        else:
+            G = np.zeros((n_obs, n_cells), dtype=dtype)
         
         # Volumen de celda
         cell_volume = dx * dy * dz
         
         # Calcular kernel (simplificado - esfera equivalente)
-        for j in range(n_cells):
-            if j % 1000 == 0:
-                print(f"      Procesando celda {j}/{n_cells}...")
-            
-            # Radio equivalente de la celda
-            r_equiv = (3 * cell_volume / (4 * np.pi))**(1/3)
-            
-            # Anomalía por susceptibilidad unitaria
-            anomaly = self.forward_magnetic_sphere(
-                x_obs, y_obs, np.zeros_like(x_obs),
-                X_cells[j], Y_cells[j], Z_cells[j],
-                r_equiv, 1.0, inclination, declination
-            )
+        # Invariantes: radio equivalente de la celda, coeficiente por
+        # susceptibilidad unitaria y observaciones en superficie (z=0) como
+        # columnas para el broadcasting
+        r_equiv = (3 * cell_volume / (4 * np.pi))**(1/3)
+        coef = _coeficiente_esfera(r_equiv, 1.0)
+        x_col = x_obs[:, None]
+        y_col = y_obs[:, None]
+        z_col = np.zeros_like(x_obs)[:, None]
+        
+        if NUMBA_AVAILABLE:
+            # Kernel compilado multihilo: las celdas son independientes, así
+            # que se reparten entre núcleos y se escribe directamente en G
+            _anomalia_dipolo_par()(x_col, y_col, z_col, X_cells, Y_cells, Z_cells, coef, out=G)
+        else:
+            # Kernel separable por capas: todas las celdas de una capa comparten
+            # dz, así que la distancia horizontal² observación-celda se calcula
+            # una sola vez (n_obs, nx*ny) y cada capa solo suma dz².
+            # Las celdas están ordenadas (x, y, z) con z más rápido, por lo que
+            # la capa k son las columnas k::nz
+            rho2 = (x_col - X_cells[::nz])**2 + (y_col - Y_cells[::nz])**2
             
-            G[:, j] = anomaly
+            for k, z_k in enumerate(z_cells):
+                print(f"      Procesando capa {k + 1}/{nz}...")
+                
+                # Anomalía por susceptibilidad unitaria (observaciones en z=0)
+                dz2 = z_k**2
+                r2 = np.maximum(rho2 + dz2, 1.0)
+                G[:, k::nz] = coef * (3 * dz2 / r2 - 1) / (r2 * np.sqrt(r2))
         
         print(f"   ✅ Matriz de sensibilidad construida: {G.shape}")
         
         # Inversión con regularización de Tikhonov
         # (G^T G + α I) m = G^T d
-        print(f"   Resolviendo sistema regularizado...")
-        
-        GTG = G.T @ G
-        GTd = G.T @ mag_obs
-        
-        # Matriz de regularización (suavidad)
-        L = np.eye(n_cells)
-        
-        # Sistema regularizado
-        A_reg = GTG + alpha * L
+        print(f"   Resolviendo sistema regularizado ({solver})...")
+        
+        if solver == 'lsmr':
+            # min ||G m - d||² + α ||m||² sobre el sistema aumentado [G; √α I],
+            # sin materializar G^T G (memoria O(n_cells) en lugar de O(n_cells²))
+            # Productos en la precisión de G, sin copias de G a float64.
+            # Precondicionado por columnas (m = P y, P = 1/‖columna‖): la
+            # sensibilidad cae con la profundidad y sin escalar lsmr necesita
+            # miles de iteraciones
+            raiz_alpha = np.sqrt(alpha)
+            P = 1.0 / np.sqrt(np.einsum('ij,ij->j', G, G).astype(np.float64) + alpha)
+            G_op = LinearOperator(
+                (n_obs + n_cells, n_cells), dtype=np.float64,
+                matvec=lambda y: np.concatenate([G @ (P * y).astype(G.dtype),
+                                                 raiz_alpha * P * y]),
+                rmatvec=lambda u: P * (G.T @ u[:n_obs].astype(G.dtype)
+                                       + raiz_alpha * u[n_obs:])
+            )
+            if tol is None:
+                tol = max(10 * np.finfo(G.dtype).eps, np.sqrt(np.finfo(np.float64).eps))
+            if max_iter is None:
+                max_iter = 10 * min(G.shape)
+            b_aum = np.concatenate([mag_obs, np.zeros(n_cells)])
+            y, istop = lsmr(G_op, b_aum, atol=tol, btol=tol, maxiter=max_iter)[:2]
+            susceptibility = P * y
+            if istop == 7:
+                warnings.warn(
+                    f"lsmr alcanzó el límite de iteraciones (max_iter={max_iter}) "
+                    "sin converger; aumentar max_iter o usar solver='cholesky'"
+                )
+        
+        elif solver == 'cholesky':
+            A_reg = (G.T @ G).astype(np.float64)
+            GTd = (G.T @ mag_obs.astype(G.dtype)).astype(np.float64)
+            
+            # Sistema regularizado: G^T G + α I sumando α solo en la diagonal
+            # (sin construir la identidad densa n_cells × n_cells)
+            A_reg.flat[::n_cells + 1] += alpha
+            
+            # Resolver: A_reg es simétrica definida positiva -> Cholesky
+            c, low = cho_factor(A_reg, lower=True, overwrite_a=True, check_finite=False)
+            susceptibility = cho_solve((c, low), GTd, check_finite=False)
         
-        # Resolver
-        susceptibility = np.linalg.solve(A_reg, GTd)
+        else:
+            raise ValueError(f"Solver '{solver}' no soportado (usar 'cholesky' o 'lsmr')")
         
         # Calcular ajuste
-        mag_calc = G @ susceptibility
+        mag_calc = (G @ susceptibility.astype(G.dtype)).astype(np.float64)
         residuales = mag_obs - mag_calc
         rms = np.sqrt(np.mean(residuales**2))
         
@@ -323,10 +494,13 @@ class TerrafInv:
             'z_cells': z_cells,
             'mag_calculated': mag_calc,
             'residuals': residuales,
-            'rms': rms,
-            'G_matrix': G
+            'rms': rms
         }
         
+        # G puede ocupar varios GB: solo se devuelve (y se mantiene viva) si se pide
+        if return_G:
+            resultado['G_matrix'] = G
+        
         return resultado
     
     # ========================================================================
@@ -362,8 +536,6 @@ class TerrafInv:
         indices = spectral_data['indices']
         
         # Interpolar datos a una grilla común
-        from scipy.interpolate import griddata
-        
         # Definir grilla común
         x_min = max(x_mag.min(), x_spec.min())
         x_max = min(x_mag.max(), x_spec.max())
@@ -381,18 +553,22 @@ class TerrafInv:
         mag_grid = griddata((x_mag, y_mag), mag, (X_grid, Y_grid), method='linear')
         
         # Normalizar magnética (0-1)
-        mag_norm = (mag_grid - np.nanmin(mag_grid)) / (np.nanmax(mag_grid) - np.nanmin(mag_grid))
+        mag_norm = _normalizar_01(mag_grid)
         
         # Interpolar índices espectrales y combinar
         spec_combined = np.zeros_like(mag_grid)
         n_indices = 0
         
+        # Triangulación de los puntos espectrales: se construye una sola vez y
+        # se reutiliza para todos los índices (misma geometría)
+        tri_spec = Delaunay(np.column_stack([x_spec, y_spec]))
+        
         for idx_name, idx_values in indices.items():
-            idx_grid = griddata((x_spec, y_spec), idx_values, (X_grid, Y_grid), method='linear')
+            idx_grid = LinearNDInterpolator(tri_spec, idx_values)(X_grid, Y_grid)
             
             if not np.all(np.isnan(idx_grid)):
                 # Normalizar
-                idx_norm = (idx_grid - np.nanmin(idx_grid)) / (np.nanmax(idx_grid) - np.nanmin(idx_grid))
+                idx_norm = _normalizar_01(idx_grid)
                 spec_combined += idx_norm
                 n_indices += 1
         
@@ -403,7 +579,7 @@ class TerrafInv:
         prospectivity = weights['mag'] * mag_norm + weights['spec'] * spec_combined
         
         # Normalizar resultado final
-        prospectivity = (prospectivity - np.nanmin(prospectivity)) / (np.nanmax(prospectivity) - np.nanmin(prospectivity))
+        prospectivity = _normalizar_01(prospectivity)
         
         print(f"   ✅ Inversión conjunta completada")
         print(f"   Prospectividad: {np.nanmin(prospectivity):.3f} - {np.nanmax(prospectivity):.3f}")
@@ -455,6 +631,9 @@ class TerrafInv:
         """
         Agrupa soluciones de Euler cercanas (clustering)
         
+        Dos soluciones quedan en el mismo cluster si están conectadas por una
+        cadena de vecinos a distancia <= radio.
+        
         Args:
             soluciones_euler (pd.DataFrame): Soluciones de Euler
             radio (float): Radio de agrupamiento (m)
@@ -462,23 +641,24 @@ class TerrafInv:
         Returns:
             pd.DataFrame: Centroides de clusters
         """
-        from scipy.cluster.hierarchy import fclusterdata
-        
         coords = soluciones_euler[['x0', 'y0', 'z0']].values
-        
-        # Clustering jerárquico
-        clusters = fclusterdata(coords, radio, criterion='distance', method='complete')
-        
-        # Calcular centroides
-        centroides = []
-        for cluster_id in np.unique(clusters):
-            mask = clusters == cluster_id
-            centroide = {
-                'x0': soluciones_euler.loc[mask, 'x0'].mean(),
-                'y0': soluciones_euler.loc[mask, 'y0'].mean(),
-                'z0': soluciones_euler.loc[mask, 'z0'].mean(),
-                'n_solutions': mask.sum()
-            }
-            centroides.append(centroide)
+        n = len(coords)
+        
+        # Pares de soluciones a menos de `radio` (KD-tree, sin matriz n×n)
+        pares = cKDTree(coords).query_pairs(r=radio, output_type='ndarray')
+        
+        # Clusters = componentes conexas del grafo de vecindad
+        adyacencia = coo_matrix(
+            (np.ones(len(pares), dtype=bool), (pares[:, 0], pares[:, 1])), shape=(n, n)
+        )
+        _, clusters = connected_components(adyacencia, directed=False)
+        
+        # Calcular centroides: sumas por cluster en una sola pasada vectorizada
+        n_solutions = np.bincount(clusters)
+        centroides = {
+            col: np.bincount(clusters, weights=coords[:, k]) / n_solutions
+            for k, col in enumerate(['x0', 'y0', 'z0'])
+        }
+        centroides['n_solutions'] = n_solutions
         
         return pd.DataFrame(centroides)
\ No newline at end of file
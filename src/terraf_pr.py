@@ -10,10 +10,14 @@ Fecha: Noviembre 2025
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import warnings
 import os
 import glob
+import math
+import functools
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Tuple, Optional, List
 warnings.filterwarnings('ignore')
 
@@ -25,6 +29,195 @@ except ImportError:
     RASTERIO_AVAILABLE = False
     print("⚠️ Rasterio no disponible - Instala con: conda install -c conda-forge rasterio")
 
+try:
+    from numba import vectorize, njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def _ratio_valido_np(num, den):
+    """
+    num / den donde num > 0, den != 0 y ambos son finitos; NaN en el resto
+    """
+    mask = (num > 0) & (den != 0) & np.isfinite(num) & np.isfinite(den)
+    return np.divide(num, den, out=np.full_like(num, np.nan, dtype=float), where=mask)
+
+
+def _ratio_valido_py(num, den):
+    # Versión escalar del ratio enmascarado, compilada con numba.vectorize
+    # (sin fastmath: las comparaciones con NaN deben respetarse)
+    if num > 0.0 and den != 0.0 and math.isfinite(num) and math.isfinite(den):
+        return num / den
+    return math.nan
+
+
+if NUMBA_AVAILABLE:
+    # Máscara + división en un solo recorrido, sin máscaras temporales.
+    # vectorize con firma compila al crearse: el ufunc se crea en el primer
+    # uso, no al importar el módulo
+    @functools.lru_cache(maxsize=None)
+    def _ratio_valido():
+        return vectorize(['float64(float64, float64)'], cache=True)(_ratio_valido_py)
+else:
+    def _ratio_valido():
+        return _ratio_valido_np
+
+
+def _estirar_rgb_np(pila, p_low, p_high):
+    """
+    (pila - p_low) / (p_high - p_low) recortado a 0-1 y NaN -> 0, como (H, W, C)
+    """
+    pila = np.clip((pila - p_low[:, None, None]) / (p_high - p_low)[:, None, None], 0, 1)
+    return np.nan_to_num(pila, copy=False).transpose(1, 2, 0)
+
+
+def _estirar_rgb_py(pila, p_low, p_high, out):
+    # Resta, división, recorte y NaN -> 0 en un solo recorrido por píxel,
+    # escribiendo directamente en (H, W, C). Sin fastmath por las NaN.
+    n_canales, alto, ancho = pila.shape
+    for i in prange(alto):
+        for j in range(ancho):
+            for c in range(n_canales):
+                v = (pila[c, i, j] - p_low[c]) / (p_high[c] - p_low[c])
+                if v != v:
+                    out[i, j, c] = 0.0
+                elif v < 0.0:
+                    out[i, j, c] = 0.0
+                elif v > 1.0:
+                    out[i, j, c] = 1.0
+                else:
+                    out[i, j, c] = v
+
+
+if NUMBA_AVAILABLE:
+    _estirar_rgb_nb = njit(parallel=True, cache=True, error_model='numpy')(_estirar_rgb_py)
+    
+    def _estirar_rgb(pila, p_low, p_high):
+        n_canales, alto, ancho = pila.shape
+        out = np.empty((alto, ancho, n_canales), dtype=pila.dtype)
+        _estirar_rgb_nb(pila, p_low, p_high, out)
+        return out
+else:
+    _estirar_rgb = _estirar_rgb_np
+
+
+def _decimar(arr: np.ndarray, max_px: int) -> np.ndarray:
+    """
+    Submuestreo por saltos (vista, sin copia) para que el lado mayor del
+    raster no supere max_px antes de pasarlo a imshow.
+    """
+    paso = max(1, -(-max(arr.shape[:2]) // max_px))
+    return arr[::paso, ::paso]
+
+
+class _ZonasEmpaquetadas(MutableMapping):
+    """
+    Diccionario de zonas (máscaras booleanas) guardadas con np.packbits:
+    1 bit por píxel en lugar de 1 byte. Al leer una zona se desempaqueta a
+    un array bool normal; el número de píxeles se cuenta una vez al guardarla.
+    """
+    
+    def __init__(self):
+        self._datos = {}  # zona -> (bits, shape, píxeles)
+    
+    def __setitem__(self, nombre, mascara):
+        mascara = np.asarray(mascara, dtype=bool)
+        self._datos[nombre] = (np.packbits(mascara, axis=None), mascara.shape,
+                               int(np.count_nonzero(mascara)))
+    
+    def __getitem__(self, nombre):
+        bits, forma, _ = self._datos[nombre]
+        return np.unpackbits(bits, count=math.prod(forma)).view(bool).reshape(forma)
+    
+    def __delitem__(self, nombre):
+        del self._datos[nombre]
+    
+    def __iter__(self):
+        return iter(self._datos)
+    
+    def __len__(self):
+        return len(self._datos)
+    
+    def conteo(self, nombre) -> int:
+        """Píxeles de la zona sin desempaquetarla"""
+        return self._datos[nombre][2]
+
+
+class _BandasDiferidas(MutableMapping):
+    """
+    Diccionario de bandas que se leen del disco la primera vez que se piden.
+    cargar_bandas() solo registra las rutas; un análisis que usa B4/B5/B6
+    nunca lee las demás. Los alias sin cero (B04 -> B4) apuntan a la misma
+    banda y comparten el array leído.
+    """
+    
+    def __init__(self):
+        self._rutas = {}    # banda -> (ruta, reducir, factor)
+        self._alias = {}    # alias -> banda
+        self._arrays = {}   # banda -> array ya leído
+        self._orden = []    # claves en orden de registro
+    
+    def registrar(self, nombre: str, ruta: str, reducir: bool = True,
+                  factor: int = 4, alias: Optional[str] = None):
+        """Registra una banda (y su alias) sin leerla"""
+        self._rutas[nombre] = (ruta, reducir, factor)
+        self._arrays.pop(nombre, None)
+        self._agregar_clave(nombre)
+        if alias:
+            self._alias[alias] = nombre
+            self._agregar_clave(alias)
+    
+    def _agregar_clave(self, clave):
+        if clave not in self._orden:
+            self._orden.append(clave)
+    
+    @staticmethod
+    def _leer(ruta, reducir, factor):
+        with rasterio.open(ruta, sharing=False) as src:
+            if reducir:
+                # Decimación durante la lectura, no después
+                return src.read(1,
+                                out_shape=(src.height // factor,
+                                           src.width // factor),
+                                resampling=Resampling.average).astype(float)
+            return src.read(1).astype(float)
+    
+    def __getitem__(self, clave):
+        nombre = self._alias.get(clave, clave)
+        if nombre not in self._arrays:
+            if nombre not in self._rutas:
+                raise KeyError(clave)
+            self._arrays[nombre] = self._leer(*self._rutas[nombre])
+        return self._arrays[nombre]
+    
+    def __setitem__(self, clave, banda):
+        # Asignación directa: reemplaza a la banda registrada
+        self._alias.pop(clave, None)
+        self._rutas.pop(clave, None)
+        self._arrays[clave] = banda
+        self._agregar_clave(clave)
+    
+    def __delitem__(self, clave):
+        if clave not in self:
+            raise KeyError(clave)
+        if clave in self._alias:
+            del self._alias[clave]
+        else:
+            self._rutas.pop(clave, None)
+            self._arrays.pop(clave, None)
+        self._orden.remove(clave)
+    
+    def __contains__(self, clave):
+        # Sin leer la banda (el __contains__ de Mapping llamaría a __getitem__)
+        return clave in self._alias or clave in self._rutas or clave in self._arrays
+    
+    def __iter__(self):
+        return iter(self._orden)
+    
+    def __len__(self):
+        return len(self._orden)
+
 
 class TerrafPR:
     """
@@ -69,11 +262,11 @@ class TerrafPR:
         """
         self.carpeta = carpeta
         self.nombre = nombre
-        self.bandas = {}
+        self.bandas = _BandasDiferidas()
         self.metadatos = {}
         self.ratios = {}
         self.indices = {}
-        self.zonas = {}
+        self.zonas = _ZonasEmpaquetadas()
         self.composiciones = {}
         
         print(f"\n{'='*80}")
@@ -219,26 +412,19 @@ class TerrafPR:
             archivos_bandas = {b: archivos_bandas[b] for b in bandas_especificas 
                               if b in archivos_bandas}
         
-        # Cargar cada banda
+        # Registrar cada banda; se lee del disco la primera vez que se usa
+        if not isinstance(self.bandas, _BandasDiferidas):
+            bandas_previas, self.bandas = self.bandas, _BandasDiferidas()
+            self.bandas.update(bandas_previas)
         for banda_nombre, ruta_archivo in sorted(archivos_bandas.items()):
-            with rasterio.open(ruta_archivo) as src:
-                if reducir:
-                    banda = src.read(1,
-                                   out_shape=(src.height // factor,
-                                             src.width // factor),
-                                   resampling=Resampling.average).astype(float)
-                else:
-                    banda = src.read(1).astype(float)
-                
-                # Guardar con ambos formatos (B01 y B1) para compatibilidad
-                self.bandas[banda_nombre] = banda
-                # También agregar alias sin cero (B04 -> B4)
-                if banda_nombre.startswith('B0'):
-                    alias = 'B' + banda_nombre[2:]
-                    self.bandas[alias] = banda
-                
-                # Guardar metadatos
-                if not self.metadatos:
+            # Guardar con ambos formatos (B01 y B1) para compatibilidad:
+            # también agregar alias sin cero (B04 -> B4)
+            alias = 'B' + banda_nombre[2:] if banda_nombre.startswith('B0') else None
+            self.bandas.registrar(banda_nombre, ruta_archivo, reducir, factor, alias)
+            
+            # Guardar metadatos (solo la cabecera del primer archivo)
+            if not self.metadatos:
+                with rasterio.open(ruta_archivo) as src:
                     # Si se redujo la imagen, ajustar el transform
                     if reducir and factor > 1:
                         # Escalar el tamaño de píxel
@@ -247,16 +433,21 @@ class TerrafPR:
                     else:
                         scaled_transform = src.transform
                     
+                    if reducir:
+                        forma = (src.height // factor, src.width // factor)
+                    else:
+                        forma = (src.height, src.width)
+                    
                     self.metadatos = {
                         'transform': scaled_transform,
                         'crs': src.crs,
-                        'width': banda.shape[1],
-                        'height': banda.shape[0],
+                        'width': forma[1],
+                        'height': forma[0],
                         'shape_original': (src.height, src.width),
                         'resolution': 30 * factor if reducir else 30
                     }
             
-            print(f"     ✅ {banda_nombre}: {self.bandas[banda_nombre].shape}")
+            print(f"     ✅ {banda_nombre}: {os.path.basename(ruta_archivo)}")
         
         print(f"\n  ✅ {len(self.bandas)} bandas cargadas")
         print(f"  📊 Resolución efectiva: {self.metadatos['resolution']}m/pixel")
@@ -267,7 +458,7 @@ class TerrafPR:
     def _crear_mascara_valida(self, *bandas_nombres):
         """
         Crea máscara de datos válidos para múltiples bandas.
-        Retorna True donde TODAS las bandas tienen valores > 0 y no son NaN.
+        Retorna True donde TODAS las bandas tienen valores > 0 y finitos (sin NaN ni inf).
         
         Args:
             *bandas_nombres: Nombres de las bandas (ej: 'B2', 'B4', 'B6')
@@ -279,9 +470,33 @@ class TerrafPR:
         for banda_nombre in bandas_nombres:
             if banda_nombre not in self.bandas:
                 raise ValueError(f"Banda {banda_nombre} no encontrada")
-            mask &= (self.bandas[banda_nombre] > 0) & (~np.isnan(self.bandas[banda_nombre]))
+            mask &= (self.bandas[banda_nombre] > 0) & np.isfinite(self.bandas[banda_nombre])
         return mask
     
+    def pixeles_zona(self, nombre: str) -> int:
+        """
+        Número de píxeles de una zona (contado una sola vez al guardarla).
+        
+        Args:
+            nombre: Clave de la zona en self.zonas (ej: 'zona_gossan')
+        
+        Returns:
+            int: Píxeles de la zona
+        """
+        return self.zonas.conteo(nombre)
+    
+    def _area_km2(self, nombre: str) -> float:
+        """
+        Área en km² de una zona de self.zonas.
+        
+        Args:
+            nombre: Clave de la zona en self.zonas
+        
+        Returns:
+            float: Área en km²
+        """
+        return self.pixeles_zona(nombre) * (self.metadatos['resolution']**2) / 1e6
+    
     def _calcular_ratio(self, numerador, denominador, nombre_resultado, tipo='ratio'):
         """
         Función reutilizable para calcular ratios o índices de manera eficiente.
@@ -299,13 +514,8 @@ class TerrafPR:
         num = numerador if isinstance(numerador, np.ndarray) else numerador
         den = denominador if isinstance(denominador, np.ndarray) else denominador
         
-        # Crear máscara de datos válidos
-        mask = (num > 0) & (den != 0) & (~np.isnan(num)) & (~np.isnan(den))
-        
-        # Calcular ratio con máscara
-        resultado = np.divide(num, den,
-                            out=np.full_like(num, np.nan, dtype=float),
-                            where=mask)
+        # Calcular ratio solo donde los datos son válidos (num > 0, den != 0, sin NaN)
+        resultado = _ratio_valido()(num, den)
         
         # Guardar resultado
         if tipo == 'ratio':
@@ -326,6 +536,26 @@ class TerrafPR:
         
         return banda_norm
     
+    def _normalizar_rgb(self, r: np.ndarray, g: np.ndarray, b: np.ndarray,
+                        percentiles: Tuple[int, int] = (2, 98),
+                        max_muestra: int = 1_000_000) -> np.ndarray:
+        """
+        Normaliza tres bandas al rango 0-1 y las compone en RGB (H, W, 3).
+        Equivale a np.dstack de _normalizar por banda, pero con una sola
+        llamada a np.nanpercentile sobre la pila (3, H, W). Se trabaja en
+        float32: es solo para visualización y mueve la mitad de bytes.
+        Los percentiles se estiman sobre una malla regular de a lo sumo
+        ~max_muestra píxeles por banda; el estiramiento se aplica a todos.
+        """
+        pila = np.stack([r, g, b], dtype=np.float32)
+        pila[pila == 0] = np.nan
+        
+        paso = max(1, math.isqrt(pila[0].size // max_muestra))
+        p_low, p_high = np.nanpercentile(pila[:, ::paso, ::paso], percentiles, axis=(1, 2))
+        
+        # Estiramiento fusionado (numba) o con operaciones de numpy
+        return _estirar_rgb(pila, p_low, p_high)
+    
     
     def crear_rgb_natural(self):
         """Crea composición RGB en color natural (R=B4, G=B3, B=B2)"""
@@ -333,11 +563,11 @@ class TerrafPR:
             raise ValueError("Faltan bandas B2, B3, B4 para RGB natural")
         
         print("🎨 Creando RGB natural...")
-        rgb = np.dstack([
-            self._normalizar(self.bandas['B4']),  # Rojo
-            self._normalizar(self.bandas['B3']),  # Verde
-            self._normalizar(self.bandas['B2'])   # Azul
-        ])
+        rgb = self._normalizar_rgb(
+            self.bandas['B4'],  # Rojo
+            self.bandas['B3'],  # Verde
+            self.bandas['B2']   # Azul
+        )
         
         self.composiciones['natural_color'] = rgb
         print("  ✅ RGB natural creado")
@@ -350,11 +580,11 @@ class TerrafPR:
             raise ValueError("Faltan bandas B3, B4, B5 para falso color")
         
         print("🎨 Creando falso color (vegetación)...")
-        rgb = np.dstack([
-            self._normalizar(self.bandas['B5']),  # NIR -> Rojo
-            self._normalizar(self.bandas['B4']),  # Rojo -> Verde
-            self._normalizar(self.bandas['B3'])   # Verde -> Azul
-        ])
+        rgb = self._normalizar_rgb(
+            self.bandas['B5'],  # NIR -> Rojo
+            self.bandas['B4'],  # Rojo -> Verde
+            self.bandas['B3']   # Verde -> Azul
+        )
         
         self.composiciones['false_color'] = rgb
         print("  ✅ Falso color creado")
@@ -367,11 +597,11 @@ class TerrafPR:
             raise ValueError("Faltan bandas B2, B5, B7 para geología")
         
         print("🎨 Creando composición geológica...")
-        rgb = np.dstack([
-            self._normalizar(self.bandas['B7']),  # SWIR2 -> Rojo
-            self._normalizar(self.bandas['B5']),  # NIR -> Verde
-            self._normalizar(self.bandas['B2'])   # Azul -> Azul
-        ])
+        rgb = self._normalizar_rgb(
+            self.bandas['B7'],  # SWIR2 -> Rojo
+            self.bandas['B5'],  # NIR -> Verde
+            self.bandas['B2']   # Azul -> Azul
+        )
         
         self.composiciones['geology_color'] = rgb
         print("  ✅ Composición geológica creada")
@@ -391,7 +621,7 @@ class TerrafPR:
         umbral = np.nanpercentile(ratio[ratio > 0], 85)
         self.zonas['zona_argilica'] = ratio > umbral
         
-        area = np.sum(self.zonas['zona_argilica']) * (self.metadatos['resolution']**2) / 1e6
+        area = self._area_km2('zona_argilica')
         
         print(f"  📊 Rango: {np.nanmin(ratio):.3f} - {np.nanmax(ratio):.3f}")
         print(f"  📊 Promedio: {np.nanmean(ratio):.3f}")
@@ -414,7 +644,7 @@ class TerrafPR:
         umbral = np.nanpercentile(ratio[ratio > 0], 80)
         self.zonas['zona_oxidos'] = ratio > umbral
         
-        area = np.sum(self.zonas['zona_oxidos']) * (self.metadatos['resolution']**2) / 1e6
+        area = self._area_km2('zona_oxidos')
         
         print(f"  📊 Rango: {np.nanmin(ratio):.3f} - {np.nanmax(ratio):.3f}")
         print(f"  📊 Promedio: {np.nanmean(ratio):.3f}")
@@ -457,7 +687,7 @@ class TerrafPR:
         umbral = np.nanpercentile(ratio[ratio > 0], 75)
         self.zonas['zona_propilitica'] = ratio > umbral
         
-        area = np.sum(self.zonas['zona_propilitica']) * (self.metadatos['resolution']**2) / 1e6
+        area = self._area_km2('zona_propilitica')
         
         print(f"  📊 Rango: {np.nanmin(ratio):.3f} - {np.nanmax(ratio):.3f}")
         print(f"  📊 Promedio: {np.nanmean(ratio):.3f}")
@@ -482,7 +712,7 @@ class TerrafPR:
         umbral = np.nanpercentile(indice[indice > 0], 30)
         self.zonas['zona_carbonatos'] = indice < umbral
         
-        area = np.sum(self.zonas['zona_carbonatos']) * (self.metadatos['resolution']**2) / 1e6
+        area = self._area_km2('zona_carbonatos')
         
         print(f"  📊 Rango: {np.nanmin(indice):.3f} - {np.nanmax(indice):.3f}")
         print(f"  📊 Promedio: {np.nanmean(indice):.3f}")
@@ -512,8 +742,8 @@ class TerrafPR:
         self.zonas['vegetacion_densa'] = vegetacion_densa
         self.zonas['sin_vegetacion'] = sin_vegetacion
         
-        area_veg = np.sum(vegetacion_densa) * (self.metadatos['resolution']**2) / 1e6
-        area_sin_veg = np.sum(sin_vegetacion) * (self.metadatos['resolution']**2) / 1e6
+        area_veg = self._area_km2('vegetacion_densa')
+        area_sin_veg = self._area_km2('sin_vegetacion')
         
         print(f"  📊 Rango: {np.nanmin(ndvi):.3f} - {np.nanmax(ndvi):.3f}")
         print(f"  📊 Promedio: {np.nanmean(ndvi):.3f}")
@@ -543,7 +773,7 @@ class TerrafPR:
         umbral = np.nanpercentile(gossan[gossan > 0], 90)
         self.zonas['zona_gossan'] = gossan > umbral
         
-        area = np.sum(self.zonas['zona_gossan']) * (self.metadatos['resolution']**2) / 1e6
+        area = self._area_km2('zona_gossan')
         
         print(f"  📊 Rango: {np.nanmin(gossan):.3f} - {np.nanmax(gossan):.3f}")
         print(f"  📊 Promedio: {np.nanmean(gossan):.3f}")
@@ -569,7 +799,7 @@ class TerrafPR:
         umbral = np.nanpercentile(indice[indice > 0], 85)
         self.zonas['zona_clay'] = indice > umbral
         
-        area = np.sum(self.zonas['zona_clay']) * (self.metadatos['resolution']**2) / 1e6
+        area = self._area_km2('zona_clay')
         
         print(f"  📊 Rango: {np.nanmin(indice):.3f} - {np.nanmax(indice):.3f}")
         print(f"  📊 Promedio: {np.nanmean(indice):.3f}")
@@ -597,7 +827,7 @@ class TerrafPR:
         umbral = np.nanpercentile(iah[iah > 0], 90)
         self.zonas['zona_iah'] = iah > umbral
         
-        area = np.sum(self.zonas['zona_iah']) * (self.metadatos['resolution']**2) / 1e6
+        area = self._area_km2('zona_iah')
         
         print(f"  📊 Rango: {np.nanmin(iah):.3f} - {np.nanmax(iah):.3f}")
         print(f"  📊 Promedio: {np.nanmean(iah):.3f}")
@@ -626,8 +856,8 @@ class TerrafPR:
         
         self.zonas['objetivos_prioritarios'] = zona_prioritaria
         
-        area = np.sum(zona_prioritaria) * (self.metadatos['resolution']**2) / 1e6
-        n_pixeles = np.sum(zona_prioritaria)
+        n_pixeles = self.pixeles_zona('objetivos_prioritarios')
+        area = n_pixeles * (self.metadatos['resolution']**2) / 1e6
         
         print(f"  ✅ Área prioritaria: {area:.3f} km²")
         print(f"  ✅ Píxeles: {n_pixeles}")
@@ -637,7 +867,8 @@ class TerrafPR:
     
     
     def show(self, tipo: str, figsize: Tuple[int, int] = (12, 10), 
-             guardar: bool = False, nombre_archivo: Optional[str] = None):
+             guardar: bool = False, nombre_archivo: Optional[str] = None,
+             mostrar: bool = True):
         """
         Muestra una visualización
         
@@ -648,8 +879,21 @@ class TerrafPR:
             figsize: Tamaño de figura
             guardar: Si True, guarda la imagen
             nombre_archivo: Nombre personalizado para guardar
+            mostrar: Si False, dibuja en una Figure fuera de pyplot (solo guardar)
         """
-        fig, ax = plt.subplots(figsize=figsize)
+        # constrained_layout reserva el espacio del título y la colorbar al
+        # dibujar, sin el ajuste iterativo de tight_layout()
+        if mostrar:
+            # pyplot solo cuando se muestra en pantalla (carga el backend)
+            import matplotlib.pyplot as plt
+            fig, ax = plt.subplots(figsize=figsize, constrained_layout=True)
+        else:
+            # Sin registro global de pyplot: nada que cerrar después
+            fig = Figure(figsize=figsize, constrained_layout=True)
+            ax = fig.subplots()
+        
+        # Píxeles que la figura puede mostrar (o guardar a 300 dpi)
+        max_px = int(max(figsize) * (300 if guardar else fig.dpi))
         
         titulo = ""
         
@@ -657,21 +901,21 @@ class TerrafPR:
         if tipo == 'natural_color':
             if 'natural_color' not in self.composiciones:
                 self.crear_rgb_natural()
-            ax.imshow(self.composiciones['natural_color'])
+            ax.imshow(_decimar(self.composiciones['natural_color'], max_px))
             titulo = f"{self.nombre} - Color Natural\n(R=B4, G=B3, B=B2)"
             ax.axis('off')
         
         elif tipo == 'false_color':
             if 'false_color' not in self.composiciones:
                 self.crear_falso_color()
-            ax.imshow(self.composiciones['false_color'])
+            ax.imshow(_decimar(self.composiciones['false_color'], max_px))
             titulo = f"{self.nombre} - Falso Color (Vegetación)\n(R=B5, G=B4, B=B3)"
             ax.axis('off')
         
         elif tipo == 'geology_color':
             if 'geology_color' not in self.composiciones:
                 self.crear_geologia_color()
-            ax.imshow(self.composiciones['geology_color'])
+            ax.imshow(_decimar(self.composiciones['geology_color'], max_px))
             titulo = f"{self.nombre} - Composición Geológica\n(R=B7, G=B5, B=B2)"
             ax.axis('off')
         
@@ -679,93 +923,93 @@ class TerrafPR:
         elif tipo == 'argilica':
             if 'argilica' not in self.ratios:
                 self.calcular_ratio_argilica()
-            im = ax.imshow(self.ratios['argilica'], cmap='hot', vmin=0.8, vmax=1.3)
+            im = ax.imshow(_decimar(self.ratios['argilica'], max_px), cmap='hot', vmin=0.8, vmax=1.3)
             if 'zona_argilica' in self.zonas:
-                ax.contour(self.zonas['zona_argilica'], levels=[0.5], 
+                ax.contour(_decimar(self.zonas['zona_argilica'], max_px), levels=[0.5], 
                           colors='cyan', linewidths=2)
-            plt.colorbar(im, ax=ax, label='Ratio B6/B7')
+            fig.colorbar(im, ax=ax, label='Ratio B6/B7')
             titulo = f"{self.nombre} - Alteración Argílica\nArcillas: Caolinita, Alunita"
             ax.axis('off')
         
         elif tipo == 'oxidos':
             if 'oxidos' not in self.ratios:
                 self.calcular_ratio_oxidos()
-            im = ax.imshow(self.ratios['oxidos'], cmap='YlOrRd', vmin=0.8, vmax=1.5)
+            im = ax.imshow(_decimar(self.ratios['oxidos'], max_px), cmap='YlOrRd', vmin=0.8, vmax=1.5)
             if 'zona_oxidos' in self.zonas:
-                ax.contour(self.zonas['zona_oxidos'], levels=[0.5], 
+                ax.contour(_decimar(self.zonas['zona_oxidos'], max_px), levels=[0.5], 
                           colors='blue', linewidths=2)
-            plt.colorbar(im, ax=ax, label='Ratio B4/B2')
+            fig.colorbar(im, ax=ax, label='Ratio B4/B2')
             titulo = f"{self.nombre} - Óxidos de Hierro\nGoethita, Hematita, Limonita"
             ax.axis('off')
         
         elif tipo == 'oh':
             if 'oh' not in self.ratios:
                 self.calcular_ratio_oh()
-            im = ax.imshow(self.ratios['oh'], cmap='viridis', vmin=0.5, vmax=2.0)
-            plt.colorbar(im, ax=ax, label='Ratio B6/B5')
+            im = ax.imshow(_decimar(self.ratios['oh'], max_px), cmap='viridis', vmin=0.5, vmax=2.0)
+            fig.colorbar(im, ax=ax, label='Ratio B6/B5')
             titulo = f"{self.nombre} - Minerales OH\nSericita, Epidota, Clorita"
             ax.axis('off')
         
         elif tipo == 'iah':
             if 'iah' not in self.indices:
                 self.calcular_iah()
-            im = ax.imshow(self.indices['iah'], cmap='plasma', vmin=1.0, vmax=3.0)
+            im = ax.imshow(_decimar(self.indices['iah'], max_px), cmap='plasma', vmin=1.0, vmax=3.0)
             if 'zona_iah' in self.zonas:
-                ax.contour(self.zonas['zona_iah'], levels=[0.5], 
+                ax.contour(_decimar(self.zonas['zona_iah'], max_px), levels=[0.5], 
                           colors='white', linewidths=2)
-            plt.colorbar(im, ax=ax, label='IAH')
+            fig.colorbar(im, ax=ax, label='IAH')
             titulo = f"{self.nombre} - Índice de Alteración Hidrotermal\nIAH = (B6+B7)/B5"
             ax.axis('off')
         
         elif tipo == 'propilitica':
             if 'propilitica' not in self.ratios:
                 self.calcular_propilitica()
-            im = ax.imshow(self.ratios['propilitica'], cmap='viridis', vmin=0.5, vmax=1.5)
+            im = ax.imshow(_decimar(self.ratios['propilitica'], max_px), cmap='viridis', vmin=0.5, vmax=1.5)
             if 'zona_propilitica' in self.zonas:
-                ax.contour(self.zonas['zona_propilitica'], levels=[0.5], 
+                ax.contour(_decimar(self.zonas['zona_propilitica'], max_px), levels=[0.5], 
                           colors='yellow', linewidths=2)
-            plt.colorbar(im, ax=ax, label='Ratio B5/B6')
+            fig.colorbar(im, ax=ax, label='Ratio B5/B6')
             titulo = f"{self.nombre} - Alteración Propilítica\nClorita, Epidota, Calcita"
             ax.axis('off')
         
         elif tipo == 'carbonatos':
             if 'carbonatos' not in self.indices:
                 self.calcular_carbonatos()
-            im = ax.imshow(self.indices['carbonatos'], cmap='cool', vmin=0.3, vmax=0.7)
+            im = ax.imshow(_decimar(self.indices['carbonatos'], max_px), cmap='cool', vmin=0.3, vmax=0.7)
             if 'zona_carbonatos' in self.zonas:
-                ax.contour(self.zonas['zona_carbonatos'], levels=[0.5], 
+                ax.contour(_decimar(self.zonas['zona_carbonatos'], max_px), levels=[0.5], 
                           colors='red', linewidths=2)
-            plt.colorbar(im, ax=ax, label='Índice Carbonatos')
+            fig.colorbar(im, ax=ax, label='Índice Carbonatos')
             titulo = f"{self.nombre} - Carbonatos\nCalcita, Dolomita, Ankerita"
             ax.axis('off')
         
         elif tipo == 'ndvi':
             if 'ndvi' not in self.indices:
                 self.calcular_ndvi()
-            im = ax.imshow(self.indices['ndvi'], cmap='RdYlGn', vmin=-0.2, vmax=0.8)
-            plt.colorbar(im, ax=ax, label='NDVI')
+            im = ax.imshow(_decimar(self.indices['ndvi'], max_px), cmap='RdYlGn', vmin=-0.2, vmax=0.8)
+            fig.colorbar(im, ax=ax, label='NDVI')
             titulo = f"{self.nombre} - Índice de Vegetación (NDVI)\nFiltro para análisis mineral"
             ax.axis('off')
         
         elif tipo == 'gossan':
             if 'gossan' not in self.indices:
                 self.calcular_gossan()
-            im = ax.imshow(self.indices['gossan'], cmap='hot', vmin=0.5, vmax=2.5)
+            im = ax.imshow(_decimar(self.indices['gossan'], max_px), cmap='hot', vmin=0.5, vmax=2.5)
             if 'zona_gossan' in self.zonas:
-                ax.contour(self.zonas['zona_gossan'], levels=[0.5], 
+                ax.contour(_decimar(self.zonas['zona_gossan'], max_px), levels=[0.5], 
                           colors='cyan', linewidths=3)
-            plt.colorbar(im, ax=ax, label='Índice Gossan')
+            fig.colorbar(im, ax=ax, label='Índice Gossan')
             titulo = f"{self.nombre} - GOSSAN (Alta Prioridad)\nCapas de Fe sobre sulfuros"
             ax.axis('off')
         
         elif tipo == 'clay_index':
             if 'clay_index' not in self.indices:
                 self.calcular_clay_index()
-            im = ax.imshow(self.indices['clay_index'], cmap='hot', vmin=0.8, vmax=2.0)
+            im = ax.imshow(_decimar(self.indices['clay_index'], max_px), cmap='hot', vmin=0.8, vmax=2.0)
             if 'zona_clay_mejorada' in self.zonas:
-                ax.contour(self.zonas['zona_clay_mejorada'], levels=[0.5], 
+                ax.contour(_decimar(self.zonas['zona_clay_mejorada'], max_px), levels=[0.5], 
                           colors='lime', linewidths=2)
-            plt.colorbar(im, ax=ax, label='Índice Arcillas Mejorado')
+            fig.colorbar(im, ax=ax, label='Índice Arcillas Mejorado')
             titulo = f"{self.nombre} - Arcillas (Índice Mejorado)\nPrecisión aumentada vs B6/B7"
             ax.axis('off')
         
@@ -774,17 +1018,17 @@ class TerrafPR:
                 self.identificar_objetivos()
             
             # Falso color de ratios
-            falso = np.dstack([
-                self._normalizar(self.ratios.get('argilica', np.zeros_like(self.bandas['B4']))),
-                self._normalizar(self.ratios.get('oh', np.zeros_like(self.bandas['B4']))),
-                self._normalizar(self.ratios.get('oxidos', np.zeros_like(self.bandas['B4'])))
-            ])
-            ax.imshow(falso)
+            falso = self._normalizar_rgb(
+                self.ratios.get('argilica', np.zeros_like(self.bandas['B4'])),
+                self.ratios.get('oh', np.zeros_like(self.bandas['B4'])),
+                self.ratios.get('oxidos', np.zeros_like(self.bandas['B4']))
+            )
+            ax.imshow(_decimar(falso, max_px))
             
             # Overlay de objetivos
             mask = np.ma.masked_where(~self.zonas['objetivos_prioritarios'],
                                      self.zonas['objetivos_prioritarios'])
-            ax.imshow(mask, cmap='Reds', alpha=0.5, vmin=0, vmax=1)
+            ax.imshow(_decimar(mask, max_px), cmap='Reds', alpha=0.5, vmin=0, vmax=1)
             
             titulo = f"{self.nombre} - OBJETIVOS PRIORITARIOS\nFalso Color: R=Argílica, G=OH, B=Óxidos"
             ax.axis('off')
@@ -795,15 +1039,15 @@ class TerrafPR:
                            "ndvi, gossan, clay_index, objetivos")
         
         ax.set_title(titulo, fontsize=14, fontweight='bold', pad=20)
-        plt.tight_layout()
         
         if guardar:
             if nombre_archivo is None:
                 nombre_archivo = f"{self.nombre.lower().replace(' ','_')}_{tipo}.png"
-            plt.savefig(nombre_archivo, dpi=300, bbox_inches='tight')
+            fig.savefig(nombre_archivo, dpi=300, bbox_inches='tight')
             print(f"  💾 Guardado: {nombre_archivo}")
         
-        plt.show()
+        if mostrar:
+            plt.show()
         
         return self
     
@@ -872,17 +1116,46 @@ class TerrafPR:
         tipos = ['natural_color', 'false_color', 'geology_color',
                 'argilica', 'oxidos', 'oh', 'iah', 'objetivos']
         
-        for i, tipo in enumerate(tipos, 1):
+        # Lo que show() calcularía bajo demanda se calcula antes y en serie,
+        # para que los hilos solo dibujen y no modifiquen el objeto a la vez
+        previos = [
+            ('natural_color', self.composiciones, 'natural_color', self.crear_rgb_natural),
+            ('false_color', self.composiciones, 'false_color', self.crear_falso_color),
+            ('geology_color', self.composiciones, 'geology_color', self.crear_geologia_color),
+            ('argilica', self.ratios, 'argilica', self.calcular_ratio_argilica),
+            ('oxidos', self.ratios, 'oxidos', self.calcular_ratio_oxidos),
+            ('oh', self.ratios, 'oh', self.calcular_ratio_oh),
+            ('iah', self.indices, 'iah', self.calcular_iah),
+            ('objetivos', self.zonas, 'objetivos_prioritarios', self.identificar_objetivos),
+        ]
+        errores = {}
+        for tipo, resultados, clave, calcular in previos:
+            if clave not in resultados:
+                try:
+                    calcular()
+                except Exception as e:
+                    # Se reporta al exportar ese tipo, sin reintentar el cálculo en los hilos
+                    errores[tipo] = e
+        
+        def exportar(i, tipo):
+            if tipo in errores:
+                print(f"  ⚠️  Error exportando {tipo}: {errores[tipo]}")
+                return False
             try:
                 nombre = f"{i:02d}_{self.nombre.lower().replace(' ','_')}_{tipo}.png"
                 if carpeta_salida:
                     nombre = os.path.join(carpeta_salida, nombre)
-                self.show(tipo, guardar=True, nombre_archivo=nombre)
-                plt.close()
+                self.show(tipo, guardar=True, nombre_archivo=nombre, mostrar=False)
+                return True
             except Exception as e:
                 print(f"  ⚠️  Error exportando {tipo}: {e}")
+                return False
+        
+        # Figuras independientes (sin pyplot): Agg y la compresión PNG liberan el GIL
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            exportadas = sum(executor.map(exportar, range(1, len(tipos) + 1), tipos))
         
-        print(f"\n✅ Exportación completada: {len(tipos)} imágenes")
+        print(f"\n✅ Exportación completada: {exportadas}/{len(tipos)} imágenes")
         
         return self
     
@@ -911,9 +1184,11 @@ class TerrafPR:
             print(f"  ✅ {indice}")
         
         print(f"\n🎯 ZONAS DETECTADAS:")
-        for zona, mascara in self.zonas.items():
-            area = np.sum(mascara) * (self.metadatos['resolution']**2) / 1e6
-            print(f"  • {zona}: {area:.3f} km² ({np.sum(mascara)} píxeles)")
+        # Un solo conteo por zona, reutilizado para área y número de píxeles
+        km2_por_pixel = (self.metadatos['resolution']**2) / 1e6
+        for zona in self.zonas:
+            n_pixeles = self.pixeles_zona(zona)
+            print(f"  • {zona}: {n_pixeles * km2_por_pixel:.3f} km² ({n_pixeles} píxeles)")
         
         print("\n" + "="*80)
         
@@ -89,21 +89,22 @@ def extraer_vegetacion_h5(archivo, bounds):
                 
                 valid = (h_canopy_f < 1e10) & (h_canopy_f >= 0)
                 
-                for i in range(len(lat_f)):
-                    if valid[i]:
-                        datos.append({
-                            'latitude': lat_f[i],
-                            'longitude': lon_f[i],
-                            'canopy_height': h_canopy_f[i],
-                            'canopy_openness': openness_f[i] if openness_f[i] < 1e10 else np.nan,
-                            'terrain_elevation': terrain_f[i] if terrain_f[i] < 1e10 else np.nan,
-                            'track': track
-                        })
+                # Un DataFrame por track con máscaras sobre los arrays completos
+                datos.append(pd.DataFrame({
+                    'latitude': lat_f[valid],
+                    'longitude': lon_f[valid],
+                    'canopy_height': h_canopy_f[valid],
+                    'canopy_openness': np.where(openness_f[valid] < 1e10, openness_f[valid], np.nan),
+                    'terrain_elevation': np.where(terrain_f[valid] < 1e10, terrain_f[valid], np.nan),
+                    'track': track
+                }))
                         
             except Exception as e:
                 continue
     
-    return pd.DataFrame(datos)
+    if not datos:
+        return pd.DataFrame()
+    return pd.concat(datos, ignore_index=True)
 
 
 def filtrar_region(h5_dir='datos/icesat2', bounds=None, shapefile=None):
@@ -231,11 +231,7 @@ def crear_visualizaciones(df):
     ax9.grid(True, alpha=0.3, axis='y')
     
     # Agregar valores en las barras
-    for i, bar in enumerate(bars):
-        height = bar.get_height()
-        ax9.text(bar.get_x() + bar.get_width()/2., height,
-                f'{int(height):,}',
-                ha='center', va='bottom', fontsize=8)
+    ax9.bar_label(bars, labels=[f'{int(h):,}' for h in archivo_counts.values], fontsize=8)
     
     plt.tight_layout()
     
@@ -0,0 +1,122 @@
+"""
+Tests unitarios para las versiones NumPy de los kernels compilados con numba
+Son las que corren si numba no está instalado; deben dar lo mismo que
+los kernels escalares
+"""
+
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+
+# Agregar src al path
+src_path = Path(__file__).parent.parent / 'src'
+sys.path.insert(0, str(src_path))
+
+import terraf_inv
+import terraf_pr
+import terraf_utils
+
+
+@pytest.fixture
+def banda():
+    """Banda 2D float32 con NaN, inf, ceros y negativos"""
+    rng = np.random.default_rng(0)
+    datos = rng.uniform(-50, 5000, (40, 30)).astype(np.float32)
+    datos[0, :5] = np.nan
+    datos[1, :3] = np.inf
+    datos[2, :4] = 0
+    return datos
+
+
+class TestAnomaliaDipolo:
+    """Tests del kernel dipolar de terraf_inv"""
+
+    @pytest.fixture
+    def geometria(self):
+        """Observaciones en superficie (columna) contra tres fuentes"""
+        x_obs = np.arange(-500, 501, 50)[:, None]
+        y_obs = np.arange(-500, 501, 50)[:, None]
+        z_obs = np.zeros_like(x_obs)
+        x_src = np.array([-100, 0, 100])
+        y_src = np.array([0, 50, -50])
+        z_src = np.array([80, 100, 150])
+        return x_obs, y_obs, z_obs, x_src, y_src, z_src
+
+    def test_coordenadas_enteras(self, geometria):
+        """Con coordenadas enteras da lo mismo que con coordenadas float"""
+        enteras = terraf_inv._anomalia_dipolo_np(*geometria, 2.5)
+        flotantes = terraf_inv._anomalia_dipolo_np(*(v.astype(np.float64) for v in geometria), 2.5)
+
+        assert enteras.dtype == np.float64
+        np.testing.assert_allclose(enteras, flotantes)
+
+    def test_coincide_con_kernel_escalar(self, geometria):
+        """La versión vectorizada reproduce el kernel escalar punto a punto"""
+        anomalia = terraf_inv._anomalia_dipolo_np(*geometria, 2.5)
+        x_obs, y_obs, z_obs, x_src, y_src, z_src = (
+            np.broadcast_arrays(*geometria)
+        )
+        esperada = [
+            terraf_inv._anomalia_dipolo_py(*map(float, valores), 2.5)
+            for valores in zip(x_obs.ravel(), y_obs.ravel(), z_obs.ravel(),
+                               x_src.ravel(), y_src.ravel(), z_src.ravel())
+        ]
+        np.testing.assert_allclose(anomalia.ravel(), esperada, rtol=1e-12)
+
+
+class TestKernelsUtils:
+    """Fallbacks NumPy de terraf_utils frente a sus kernels escalares"""
+
+    def test_resumen_validos(self, banda):
+        n, vmin, vmax, media, std, counts = terraf_utils._resumen_validos_np(banda.ravel(), 30)
+        esperado = terraf_utils._resumen_validos_py(banda.ravel(), 30)
+
+        assert n == esperado[0]
+        np.testing.assert_allclose([vmin, vmax, media, std], esperado[1:5], rtol=1e-9)
+        np.testing.assert_array_equal(counts, esperado[5])
+
+    def test_resumen_validos_sin_datos(self):
+        datos = np.full(10, np.nan)
+        assert terraf_utils._resumen_validos_np(datos, 5)[0] == 0
+        assert terraf_utils._resumen_validos_py(datos, 5)[0] == 0
+
+    def test_mascara_rgb(self, banda):
+        r, g, b = banda, banda[::-1], np.roll(banda, 7, axis=1)
+        np.testing.assert_array_equal(terraf_utils._mascara_rgb_np(r, g, b),
+                                      terraf_utils._mascara_rgb_py(r, g, b))
+
+    def test_estirar_uint8(self, banda):
+        banda = np.nan_to_num(banda, nan=0, posinf=0)
+        escala = np.float32(255 / 3000)
+        out_np = np.empty(banda.shape, dtype=np.uint8)
+        out_py = np.empty(banda.shape, dtype=np.uint8)
+        terraf_utils._estirar_uint8_np(banda, 100.0, escala, out_np)
+        terraf_utils._estirar_uint8_py(banda, 100.0, escala, out_py)
+        np.testing.assert_array_equal(out_np, out_py)
+
+
+class TestKernelsPR:
+    """Fallbacks NumPy de terraf_pr frente a sus kernels escalares"""
+
+    def test_ratio_valido(self, banda):
+        num = banda.astype(np.float64)
+        den = np.roll(num, 3, axis=0)
+        with np.errstate(invalid='ignore'):
+            esperado = np.vectorize(terraf_pr._ratio_valido_py)(num, den)
+        np.testing.assert_allclose(terraf_pr._ratio_valido_np(num, den), esperado,
+                                   equal_nan=True)
+
+    @pytest.mark.skipif(not terraf_pr.NUMBA_AVAILABLE, reason="el kernel escalar usa numba.prange")
+    def test_estirar_rgb(self, banda):
+        pila = np.stack([banda, banda[::-1], np.roll(banda, 5, axis=1)]).astype(np.float64)
+        p_low = np.array([100.0, 200.0, 50.0])
+        p_high = np.array([3000.0, 4000.0, 4500.0])
+        out = np.empty((*pila.shape[1:], 3))
+        terraf_pr._estirar_rgb_py(pila, p_low, p_high, out)
+        np.testing.assert_allclose(terraf_pr._estirar_rgb_np(pila, p_low, p_high), out)
+
+
+if __name__ == "__main__":
+    # Ejecutar tests
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,83 @@
+"""
+Tests unitarios para los solvers de la inversión 3D de susceptibilidad
+Valida que el solver iterativo 'lsmr' converja a la misma solución que 'cholesky'
+"""
+
+import sys
+import warnings
+from pathlib import Path
+import numpy as np
+import pytest
+
+# Agregar src al path
+src_path = Path(__file__).parent.parent / 'src'
+sys.path.insert(0, str(src_path))
+
+from terraf_inv import TerrafInv
+
+
+class TestSolversInversion:
+    """Tests de equivalencia entre solvers de inversion_susceptibility_3d"""
+
+    @pytest.fixture
+    def problema(self):
+        """Problema pequeño: 200 observaciones y malla 8×8×4 (256 celdas)"""
+        rng = np.random.default_rng(0)
+        x_obs = rng.uniform(0, 1000, 200)
+        y_obs = rng.uniform(0, 1000, 200)
+        mag_obs = rng.normal(0, 50, 200)
+        mesh_params = {'nx': 8, 'ny': 8, 'nz': 4, 'dx': 125, 'dy': 125,
+                       'dz': 50, 'z_top': 25}
+        return x_obs, y_obs, mag_obs, mesh_params
+
+    @staticmethod
+    def _objetivo(G, mag_obs, modelo, alpha=1.0):
+        """Funcional de Tikhonov ||G m - d||² + α ||m||² que minimizan ambos solvers"""
+        m = modelo.ravel()
+        return np.sum((G @ m - mag_obs)**2) + alpha * np.sum(m**2)
+
+    def test_lsmr_coincide_con_cholesky(self, problema):
+        """lsmr con la tolerancia por defecto reproduce la solución directa (float64)"""
+        inv = TerrafInv()
+        directo = inv.inversion_susceptibility_3d(*problema, solver='cholesky',
+                                                  dtype=np.float64, return_G=True)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            iterativo = inv.inversion_susceptibility_3d(*problema, solver='lsmr',
+                                                        dtype=np.float64)
+
+        m_dir = directo['susceptibility_3d']
+        m_it = iterativo['susceptibility_3d']
+        error = np.linalg.norm(m_it - m_dir) / np.linalg.norm(m_dir)
+        assert error < 1e-3, f"lsmr difiere de cholesky: error relativo {error:.2e}"
+
+        G, mag_obs = directo['G_matrix'], problema[2]
+        f_dir = self._objetivo(G, mag_obs, m_dir)
+        f_it = self._objetivo(G, mag_obs, m_it)
+        assert f_it / f_dir - 1 < 1e-6, f"Funcional de lsmr {f_it:.6e} > cholesky {f_dir:.6e}"
+
+    def test_lsmr_float32_converge_sin_aviso(self, problema):
+        """Con la precisión por defecto (float32) lsmr converge sin agotar max_iter"""
+        inv = TerrafInv()
+        directo = inv.inversion_susceptibility_3d(*problema, solver='cholesky',
+                                                  dtype=np.float64, return_G=True)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            iterativo = inv.inversion_susceptibility_3d(*problema, solver='lsmr')
+
+        G, mag_obs = directo['G_matrix'], problema[2]
+        f_dir = self._objetivo(G, mag_obs, directo['susceptibility_3d'])
+        f_it = self._objetivo(G, mag_obs, iterativo['susceptibility_3d'])
+        assert f_it / f_dir - 1 < 1e-3, f"Funcional de lsmr {f_it:.6e} > cholesky {f_dir:.6e}"
+
+    def test_lsmr_avisa_limite_iteraciones(self, problema):
+        """lsmr avisa si se alcanza max_iter sin converger"""
+        inv = TerrafInv()
+        with pytest.warns(UserWarning, match="límite de iteraciones"):
+            inv.inversion_susceptibility_3d(*problema, solver='lsmr',
+                                            dtype=np.float64, max_iter=5)
+
+
+if __name__ == "__main__":
+    # Ejecutar tests
+    pytest.main([__file__, "-v", "-s"])